@@ -16,6 +16,7 @@ login_manager = LoginManager()
 def register_extensions(app):
     db.init_app(app)
     login_manager.init_app(app)
+    reading_cache.init_app(app)
 
 def register_blueprints(app):
     for module_name in ('authentication', 'home', 'dyn_dt', 'charts', ):
@@ -24,6 +25,8 @@ def register_blueprints(app):
 
 from apps.authentication.oauth import github_blueprint, google_blueprint
 from apps.authentication.models import Users, Farms, OAuth
+from apps.home.models import Readings, ReadingRollups, Devices, DeviceLabels
+from apps.home.reading_cache import reading_cache
 
 def create_app(config):
 
@@ -51,4 +54,8 @@ def create_app(config):
     with app.app_context():
         db.create_all()
 
+    if app.config.get('READING_SYNC_INTERVAL'):
+        from apps.home.reading_store import start_background_sync
+        start_background_sync(app, app.config['READING_SYNC_INTERVAL'])
+
     return app
@@ -18,6 +18,13 @@ class Config(object):
     CELERY_RESULT_BACKEND = "redis://localhost:6379"
     CELERY_HOSTMACHINE    = "celery@app-generator"
 
+    # Latest-reading cache (dashboard). Set READING_CACHE_REDIS_URL (e.g. the celery redis) to share it between workers
+    READING_CACHE_TTL       = float(os.getenv('READING_CACHE_TTL', 3))
+    READING_CACHE_REDIS_URL = os.getenv('READING_CACHE_REDIS_URL', None)
+
+    # Local readings store: background incremental sync from core-data (seconds, 0 = disabled)
+    READING_SYNC_INTERVAL   = float(os.getenv('READING_SYNC_INTERVAL', 60))
+
     # Set up the App SECRET_KEY
     SECRET_KEY  = os.getenv('SECRET_KEY', 'S3cret_999')
 
@@ -0,0 +1,266 @@
+# -*- encoding: utf-8 -*-
+"""
+Gom nhóm readings theo khung thời gian cố định (giờ / ngày) cho trang thống kê.
+
+Toàn bộ tính toán là vector hóa bằng NumPy: mỗi reading được gán vào bucket bằng
+searchsorted trên mảng mốc thời gian, sau đó min/max/sum/count được tính bằng reduceat.
+Số bucket chỉ phụ thuộc vào timeRange, không phụ thuộc tần suất lấy mẫu.
+"""
+
+import datetime
+import struct
+
+import numpy as np
+
+NS_PER_SECOND = 1_000_000_000
+NS_PER_HOUR   = 3600 * NS_PER_SECOND
+
+
+def bucket_edges(time_range, selected_date):
+    """
+    Tính các mốc bucket (giờ địa phương) cho một timeRange.
+
+    Args:
+        time_range (str): 'day' (24 bucket theo giờ), 'week' (7 ngày từ thứ Hai), 'month' (các ngày trong tháng).
+        selected_date (str): ngày 'yyyy-mm-dd' nằm trong khoảng cần xem.
+
+    Returns:
+        tuple: (list datetime gồm n+1 mốc, định dạng nhãn strftime)
+    """
+    dt = datetime.datetime.fromisoformat(selected_date).replace(hour=0, minute=0, second=0, microsecond=0)
+    if time_range == "week":
+        start = dt - datetime.timedelta(days=dt.weekday())
+        return [start + datetime.timedelta(days=i) for i in range(8)], "%d/%m"
+    if time_range == "month":
+        start = dt.replace(day=1)
+        next_month = (start + datetime.timedelta(days=32)).replace(day=1)
+        days = (next_month - start).days
+        return [start + datetime.timedelta(days=i) for i in range(days + 1)], "%d/%m"
+    return [dt + datetime.timedelta(hours=i) for i in range(25)], "%H:%M"
+
+
+def rollup_period(time_range):
+    """Rollup thô nhất vẫn đủ độ phân giải cho timeRange: bucket giờ cần rollup 'hour', bucket ngày dùng 'day'."""
+    return "hour" if time_range == "day" else "day"
+
+
+def local_midnight_ns(origin_ns):
+    """Mốc nửa đêm (giờ địa phương) của ngày chứa origin_ns."""
+    day = datetime.datetime.fromtimestamp(int(origin_ns) // NS_PER_SECOND).replace(hour=0, minute=0, second=0, microsecond=0)
+    return int(day.timestamp()) * NS_PER_SECOND
+
+
+def local_hour_starts_ns(origins):
+    """
+    Mốc đầu giờ (giờ địa phương) chứa mỗi origin, vector hóa.
+    Đúng cả với múi giờ lệch nửa giờ (+05:30...): độ lệch UTC chỉ được tính một lần cho mỗi
+    khoảng 15 phút có reading (mọi lần đổi giờ đều rơi vào mốc 15 phút UTC).
+    """
+    quarters = origins - origins % (NS_PER_HOUR // 4)
+    unique_quarters, index = np.unique(quarters, return_inverse=True)
+    offsets = np.array([
+        int(datetime.datetime.fromtimestamp(int(q) // NS_PER_SECOND).astimezone().utcoffset().total_seconds()) * NS_PER_SECOND
+        for q in unique_quarters
+    ], dtype=np.int64)[index]
+    return origins - (origins + offsets) % NS_PER_HOUR
+
+
+def to_ns(edges):
+    """Chuyển các mốc datetime (giờ địa phương) sang mảng epoch nano giây."""
+    return np.array([int(e.timestamp()) * NS_PER_SECOND for e in edges], dtype=np.int64)
+
+
+def merge_buckets(bucket_index, mins, maxs, sums, counts, n):
+    """
+    Gộp các phần tử (đã sắp xếp theo bucket_index tăng dần) vào n bucket.
+
+    Returns:
+        dict: mảng 'min', 'max', 'sum', 'count' độ dài n (bucket rỗng: min/max = NaN, count = 0)
+    """
+    out = {
+        "min": np.full(n, np.nan),
+        "max": np.full(n, np.nan),
+        "sum": np.zeros(n),
+        "count": np.zeros(n, dtype=np.int64),
+    }
+    mask = (bucket_index >= 0) & (bucket_index < n)
+    if not mask.any():
+        return out
+
+    bucket_index = bucket_index[mask]
+    starts = np.flatnonzero(np.diff(bucket_index, prepend=-1))
+    buckets = bucket_index[starts]
+    out["min"][buckets] = np.minimum.reduceat(mins[mask], starts)
+    out["max"][buckets] = np.maximum.reduceat(maxs[mask], starts)
+    out["sum"][buckets] = np.add.reduceat(sums[mask], starts)
+    out["count"][buckets] = np.add.reduceat(counts[mask], starts)
+    return out
+
+
+def aggregate(origins, values, edges_ns):
+    """
+    Tính min/max/sum/count của các reading trong từng bucket [edges[i], edges[i+1]).
+
+    Args:
+        origins (np.ndarray): epoch nano giây, tăng dần.
+        values (np.ndarray): giá trị tương ứng.
+        edges_ns (np.ndarray): n+1 mốc bucket.
+    """
+    bucket_index = np.searchsorted(edges_ns, origins, side="right") - 1
+    return merge_buckets(bucket_index, values, values, values, np.ones(len(values), dtype=np.int64), len(edges_ns) - 1)
+
+
+def aggregate_rollups(bucket_starts, mins, maxs, sums, counts, edges_ns):
+    """Giống aggregate() nhưng đầu vào là các dòng rollup (bucket_starts tăng dần) thay vì reading thô."""
+    bucket_index = np.searchsorted(edges_ns, bucket_starts, side="right") - 1
+    return merge_buckets(bucket_index, mins, maxs, sums, counts, len(edges_ns) - 1)
+
+
+def compute_rollups(origins, values):
+    """
+    Tính rollup theo giờ và theo ngày cho một lô reading.
+
+    Returns:
+        dict: {'hour': (bucket_starts, buckets), 'day': (bucket_starts, buckets)} với buckets là
+              kết quả của merge_buckets.
+    """
+    order = np.argsort(origins, kind="stable")
+    origins, values = origins[order], values[order]
+
+    hours = local_hour_starts_ns(origins)
+    hour_starts, hour_index = np.unique(hours, return_inverse=True)
+    hourly = merge_buckets(hour_index, values, values, values, np.ones(len(values), dtype=np.int64), len(hour_starts))
+
+    # Số giờ khác nhau ít hơn nhiều so với số reading nên đổi sang ngày địa phương theo từng giờ
+    day_of_hour = np.array([local_midnight_ns(h) for h in hour_starts], dtype=np.int64)
+    day_starts, day_index = np.unique(day_of_hour, return_inverse=True)
+    daily = merge_buckets(day_index, hourly["min"], hourly["max"], hourly["sum"], hourly["count"], len(day_starts))
+
+    return {"hour": (hour_starts, hourly), "day": (day_starts, daily)}
+
+
+def lttb(x, y, n_out):
+    """
+    Largest-Triangle-Three-Buckets: chọn n_out điểm giữ hình dạng đường của chuỗi (x, y).
+    Vòng lặp chỉ chạy theo số bucket đầu ra; diện tích tam giác trong mỗi bucket tính vector hóa.
+
+    Returns:
+        np.ndarray: chỉ số các điểm được giữ lại (tăng dần).
+    """
+    n = len(x)
+    if n_out >= n:
+        return np.arange(n)
+    if n_out < 3:
+        return np.linspace(0, n - 1, max(n_out, 0)).astype(np.int64)
+
+    x = x.astype(np.float64)
+    y = y.astype(np.float64)
+    # n_out - 2 bucket cho các điểm ở giữa; điểm đầu và cuối luôn được giữ
+    bounds = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = bounds[i], bounds[i + 1]
+        if i + 2 < len(bounds):
+            next_lo, next_hi = bounds[i + 1], bounds[i + 2]
+            cx, cy = x[next_lo:next_hi].mean(), y[next_lo:next_hi].mean()
+        else:
+            cx, cy = x[-1], y[-1]
+        areas = np.abs((x[a] - cx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (cy - y[a]))
+        a = lo + int(np.argmax(areas))
+        selected[i + 1] = a
+    return selected
+
+
+def minmax_downsample(y, n_out):
+    """
+    Giữ điểm nhỏ nhất và lớn nhất của mỗi bucket (n_out // 2 bucket theo chỉ số) để không mất đỉnh / đáy.
+
+    Returns:
+        np.ndarray: chỉ số các điểm được giữ lại (tăng dần).
+    """
+    n = len(y)
+    n_buckets = max(n_out // 2, 1)
+    if n <= n_out:
+        return np.arange(n)
+
+    bucket = (np.arange(n) * n_buckets) // n
+    # Sắp xếp theo (bucket, giá trị): phần tử đầu mỗi bucket là min, phần tử cuối là max
+    order = np.lexsort((y, bucket))
+    firsts = np.flatnonzero(np.diff(bucket[order], prepend=-1))
+    lasts = np.append(firsts[1:] - 1, n - 1)
+    return np.unique(np.concatenate((order[firsts], order[lasts])))
+
+
+def bucket_averages(buckets):
+    """Trung bình từng bucket (NaN nếu bucket rỗng)."""
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return buckets["sum"] / buckets["count"]
+
+
+def _num(x):
+    return None if np.isnan(x) else round(float(x), 3)
+
+
+def _num_list(values):
+    return [_num(x) for x in values.tolist()]
+
+
+def to_series(buckets, edges, label_format):
+    """Chuyển kết quả bucket sang list dict cho JSON; 'value' là trung bình (None nếu bucket rỗng)."""
+    counts = buckets["count"]
+    avgs = bucket_averages(buckets)
+
+    series = []
+    for i in range(len(counts)):
+        avg = _num(avgs[i])
+        series.append({
+            "time": edges[i].strftime(label_format),
+            "start": int(edges[i].timestamp() * 1000),
+            "value": avg,
+            "avg": avg,
+            "min": _num(buckets["min"][i]),
+            "max": _num(buckets["max"][i]),
+            "count": int(counts[i])
+        })
+    return series
+
+
+def to_point_series(origins, values, label_format):
+    """Chuỗi điểm thô (đã downsample) cho JSON."""
+    series = []
+    for origin, value in zip(origins.tolist(), values.tolist()):
+        dt = datetime.datetime.fromtimestamp(origin // NS_PER_SECOND)
+        series.append({
+            "time": dt.strftime(label_format),
+            "start": origin // 1_000_000,
+            "value": round(value, 3)
+        })
+    return series
+
+
+def to_columns(timestamps_ms, values, **extra):
+    """
+    Dạng cột (format=columnar): các mảng song song thay vì một dict cho mỗi điểm.
+    NaN được trả về là null.
+    """
+    columns = {
+        "timestamps": np.asarray(timestamps_ms, dtype=np.int64).tolist(),
+        "values": _num_list(np.asarray(values, dtype=np.float64))
+    }
+    for name, column in extra.items():
+        columns[name] = column if isinstance(column, list) else _num_list(np.asarray(column, dtype=np.float64))
+    return columns
+
+
+def pack_binary(timestamps_ms, values):
+    """
+    Dạng nhị phân (format=binary), little-endian:
+        uint32 n | uint32 0 (padding) | float64[n] timestamp ms | float32[n] value (NaN = không có dữ liệu)
+    Trình duyệt đọc trực tiếp bằng Float64Array / Float32Array, không cần parse JSON.
+    """
+    timestamps_ms = np.asarray(timestamps_ms, dtype="<f8")
+    values = np.asarray(values, dtype="<f4")
+    return struct.pack("<II", len(timestamps_ms), 0) + timestamps_ms.tobytes() + values.tobytes()
@@ -0,0 +1,345 @@
+# -*- encoding: utf-8 -*-
+"""
+Hàng đợi lệnh điều khiển relay.
+
+- Request HTTP chỉ xếp lệnh vào hàng đợi và nhận lại id ngay; việc gửi PUT tới core-command
+  và đọc lại trạng thái chạy trong thread pool nền.
+- Lệnh của cùng một device chạy tuần tự theo thứ tự gửi (một luồng xử lý mỗi device tại một
+  thời điểm), nên các lần bấm liên tiếp trên cùng relay không chạy đè lên nhau.
+- Gộp lệnh thừa: lệnh mới cho cùng resource thay thế lệnh cũ còn đang chờ (chỉ trạng thái cuối
+  cùng được gửi); bấm trùng trạng thái với lệnh đang chờ / đang chạy trả về lệnh đó.
+- Sau PUT, trạng thái relay được xác nhận theo COMMAND_VERIFY_STRATEGY, ngay trong luồng nền:
+    poll:  đọc lại qua core-command, khoảng cách tăng gấp đôi (COMMAND_VERIFY_INTERVAL, ...) tới
+           khi khớp hoặc hết COMMAND_VERIFY_TIMEOUT giây;
+    event: chờ snapshot mới từ StreamHub (reading do device đẩy lên core-data) có giá trị khớp,
+           hết hạn thì đọc lại một lần qua core-command.
+  Relay chậm vì thế không còn bị báo thất bại ngay, tránh việc giao diện gửi lại lệnh.
+- Trạng thái lệnh (queued, running, succeeded, unconfirmed, failed, coalesced) được giữ trong
+  process COMMAND_RETENTION giây để client hỏi lại. gunicorn chạy một worker nên mọi request
+  thấy cùng một hàng đợi.
+- submit_group(): lệnh nhóm (nhiều relay, một hoặc nhiều device) được xếp vào hàng đợi của từng
+  device như lệnh đơn, nên vẫn giữ thứ tự với các lệnh đơn của device đó. Các lệnh cùng nhóm của
+  một device chạy thành một lượt: các PUT gửi song song qua client bất đồng bộ, rồi xác nhận bằng
+  các lượt đọc lại theo lô (mỗi lượt đọc song song các relay chưa khớp) với cùng backoff như poll.
+"""
+
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from . import edgex_interface as edgex
+from .edgex_async import edgex_sync
+from .reading_cache import reading_cache
+
+COMMAND_WORKERS   = int(os.getenv("COMMAND_WORKERS", 8))
+COMMAND_RETENTION = float(os.getenv("COMMAND_RETENTION", 300))  # Giây
+
+COMMAND_VERIFY_STRATEGY     = os.getenv("COMMAND_VERIFY_STRATEGY", "poll")      # poll | event
+COMMAND_VERIFY_TIMEOUT      = float(os.getenv("COMMAND_VERIFY_TIMEOUT", 5))     # Giây
+COMMAND_VERIFY_INTERVAL     = float(os.getenv("COMMAND_VERIFY_INTERVAL", 0.2))  # Giây, nhân đôi sau mỗi lần đọc
+COMMAND_VERIFY_MAX_INTERVAL = 1.6
+
+
+class Command:
+    def __init__(self, device_name, command_name, state, group=None):
+        self.id = uuid.uuid4().hex
+        self.group = group
+        self.device_name = device_name
+        self.command_name = command_name
+        self.state = state
+        self.status = "queued"
+        self.acknowledged = False
+        self.actual_state = None
+        self.superseded_by = None
+        self.verify_reads = 0
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.done = threading.Event()
+
+    def finish(self, status, error=None):
+        self.status = status
+        self.error = error
+        self.finished_at = time.time()
+        self.done.set()
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "device": self.device_name,
+            "command": self.command_name,
+            "group": self.group,
+            "state": self.state,
+            "status": self.status,
+            "acknowledged": self.acknowledged,
+            "actual_state": self.actual_state,
+            "superseded_by": self.superseded_by,
+            "verify_reads": self.verify_reads,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at
+        }
+
+
+def read_state(device_name, command_name):
+    """Đọc trạng thái hiện tại của relay qua core-command ('true' / 'false' / None)."""
+    verify = edgex.send_command(device_name=device_name, command_name=command_name, method="GET")
+    value = verify.get(command_name)
+    return None if value is None else str(value).lower()
+
+
+def verify_by_polling(command, timeout=COMMAND_VERIFY_TIMEOUT, interval=COMMAND_VERIFY_INTERVAL):
+    """Đọc lại trạng thái với backoff lũy thừa tới khi khớp hoặc hết hạn. Returns: trạng thái đọc được cuối cùng."""
+    deadline = time.monotonic() + timeout
+    delay = interval
+    while True:
+        actual = read_state(command.device_name, command.command_name)
+        command.verify_reads += 1
+        remaining = deadline - time.monotonic()
+        if actual == command.state or remaining <= 0:
+            return actual
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 2, COMMAND_VERIFY_MAX_INTERVAL)
+
+
+def verify_by_event(command, hub, timeout=COMMAND_VERIFY_TIMEOUT):
+    """
+    Chờ snapshot của StreamHub có reading của relay mới hơn lúc gửi lệnh và khớp trạng thái;
+    hết hạn thì đọc lại một lần qua core-command.
+    """
+    since_ns = int(command.started_at * 1_000_000_000)
+    deadline = time.monotonic() + timeout
+    q = hub.subscribe(command.device_name)
+    try:
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                snapshot = q.get(timeout=remaining)
+            except queue.Empty:
+                break
+            value = snapshot["values"].get(command.command_name)
+            origin = int(snapshot["origins"].get(command.command_name) or 0)
+            if origin >= since_ns and value is not None and str(value).lower() == command.state:
+                return command.state
+    finally:
+        hub.unsubscribe(command.device_name, q)
+
+    command.verify_reads += 1
+    return read_state(command.device_name, command.command_name)
+
+
+def _response_state(response, command_name):
+    if not isinstance(response, dict) or response.get(command_name) is None:
+        return None
+    return str(response[command_name]).lower()
+
+
+def verify_group_by_polling(commands, timeout=COMMAND_VERIFY_TIMEOUT, interval=COMMAND_VERIFY_INTERVAL):
+    """
+    Xác nhận nhiều lệnh cùng lúc: mỗi lượt đọc lại song song các relay chưa khớp, backoff như
+    verify_by_polling. Ghi actual_state / acknowledged / verify_reads vào từng Command.
+    """
+    client = edgex_sync.client
+    deadline = time.monotonic() + timeout
+    delay = interval
+    unconfirmed = list(commands)
+    while unconfirmed:
+        responses = edgex_sync.gather([
+            client.send_command(c.device_name, c.command_name, method="GET") for c in unconfirmed
+        ])
+        for command, response in zip(unconfirmed, responses):
+            command.verify_reads += 1
+            command.actual_state = _response_state(response, command.command_name)
+            command.acknowledged = command.actual_state == command.state
+        unconfirmed = [c for c in unconfirmed if not c.acknowledged]
+
+        remaining = deadline - time.monotonic()
+        if not unconfirmed or remaining <= 0:
+            return
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 2, COMMAND_VERIFY_MAX_INTERVAL)
+
+
+class CommandQueue:
+    def __init__(self, workers=COMMAND_WORKERS, retention=COMMAND_RETENTION, verify_strategy=COMMAND_VERIFY_STRATEGY):
+        self.workers = workers
+        self.retention = retention
+        self.verify_strategy = verify_strategy
+        self.hub = None          # StreamHub cho verify_strategy="event"
+        self._commands = {}      # id -> Command
+        self._pending = {}       # device_name -> deque[Command] chưa chạy
+        self._running = {}       # device_name -> [Command] đang chạy (rỗng giữa hai lượt)
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+
+    def _get_executor(self):
+        pid = os.getpid()
+        if self._executor is None or self._pid != pid:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="command")
+            self._pid = pid
+        return self._executor
+
+    def attach_stream(self, hub):
+        """Dùng StreamHub của dashboard làm nguồn reading cho verify_strategy="event"."""
+        self.hub = hub
+
+    def _verify(self, command):
+        if self.verify_strategy == "event" and self.hub is not None and command.command_name in self.hub.resource_names:
+            return verify_by_event(command, self.hub)
+        return verify_by_polling(command)
+
+    def _prune(self):
+        cutoff = time.time() - self.retention
+        for command_id in [c.id for c in self._commands.values() if c.finished_at and c.finished_at < cutoff]:
+            del self._commands[command_id]
+
+    def _enqueue(self, device_name, command_name, state, group=None):
+        """Xếp lệnh vào hàng đợi của device (đã giữ self._lock). Returns: Command (có thể là lệnh trùng đã có)."""
+        pending = self._pending.setdefault(device_name, deque())
+
+        running = [c for c in self._running.get(device_name) or [] if c.command_name == command_name]
+        waiting = [c for c in pending if c.command_name == command_name]
+        if waiting and waiting[-1].state == state:
+            return waiting[-1]
+        if not waiting and running and running[-1].state == state:
+            return running[-1]
+
+        command = Command(device_name, command_name, state, group)
+        self._commands[command.id] = command
+        for old in waiting:
+            pending.remove(old)
+            old.superseded_by = command.id
+            old.finish("coalesced")
+
+        pending.append(command)
+        if device_name not in self._running:
+            self._running[device_name] = []
+            self._get_executor().submit(self._drain, device_name)
+        return command
+
+    def submit(self, device_name, command_name, state):
+        """Xếp một lệnh vào hàng đợi của device. Returns: Command (có thể là lệnh trùng đã có)."""
+        with self._lock:
+            self._prune()
+            return self._enqueue(device_name, command_name, state)
+
+    def submit_group(self, items):
+        """
+        Xếp một nhóm lệnh relay vào hàng đợi của từng device.
+
+        Args:
+            items (list): [(device_name, command_name, state)], state là 'true' / 'false'.
+                          Cùng (device, command) xuất hiện nhiều lần thì lệnh sau cùng được dùng.
+
+        Returns:
+            list: các Command theo thứ tự (device, command) xuất hiện lần đầu; các lệnh mới
+                  có chung Command.group
+        """
+        latest = {}
+        for device_name, command_name, state in items:
+            latest[(device_name, command_name)] = state
+        group = uuid.uuid4().hex
+        with self._lock:
+            self._prune()
+            return [self._enqueue(device, command, state, group) for (device, command), state in latest.items()]
+
+    def _drain(self, device_name):
+        """Chạy lần lượt các lệnh đang chờ của một device cho tới khi hết; lệnh liền nhau cùng nhóm chạy chung một lượt."""
+        while True:
+            with self._lock:
+                pending = self._pending.get(device_name)
+                if not pending:
+                    self._pending.pop(device_name, None)
+                    self._running.pop(device_name, None)
+                    return
+                batch = [pending.popleft()]
+                while pending and batch[0].group is not None and pending[0].group == batch[0].group:
+                    batch.append(pending.popleft())
+                for command in batch:
+                    command.status = "running"
+                    command.started_at = time.time()
+                self._running[device_name] = batch
+            try:
+                if len(batch) == 1:
+                    self._execute(batch[0])
+                else:
+                    self._execute_group(batch)
+            except Exception as e:
+                logging.error(f"Command {batch[0].id} error: {e}")
+                for command in batch:
+                    if not command.done.is_set():
+                        command.finish("failed", str(e))
+            finally:
+                with self._lock:
+                    self._running[device_name] = []
+
+    def _execute(self, command):
+        result = edgex.send_command(
+            device_name=command.device_name,
+            command_name=command.command_name,
+            method="PUT",
+            body={command.command_name: command.state}
+        )
+        # Giá trị relay trong cache không còn đúng, kể cả khi lệnh lỗi
+        reading_cache.invalidate(command.device_name, command.command_name)
+        if result.get("statusCode") != 200:
+            command.finish("failed", "Failed to send command to core-command")
+            return
+
+        command.actual_state = self._verify(command)
+        command.acknowledged = command.actual_state == command.state
+        command.finish("succeeded" if command.acknowledged else "unconfirmed")
+
+    def _execute_group(self, commands):
+        """Gửi song song các PUT của một lượt rồi xác nhận tất cả bằng các lượt đọc lại theo lô."""
+        client = edgex_sync.client
+        responses = edgex_sync.gather([
+            client.send_command(c.device_name, c.command_name, method="PUT", body={c.command_name: c.state})
+            for c in commands
+        ])
+        sent = []
+        for command, response in zip(commands, responses):
+            reading_cache.invalidate(command.device_name, command.command_name)
+            if isinstance(response, dict) and response.get("statusCode") == 200:
+                sent.append(command)
+            else:
+                command.finish("failed", "Failed to send command to core-command")
+
+        verify_group_by_polling(sent)
+        for command in sent:
+            command.finish("succeeded" if command.acknowledged else "unconfirmed")
+
+    def get(self, command_id):
+        with self._lock:
+            return self._commands.get(command_id)
+
+    def wait(self, command_id, timeout=None):
+        """Chờ lệnh kết thúc tối đa timeout giây. Returns: Command hoặc None nếu không tồn tại."""
+        command = self.get(command_id)
+        if command is not None:
+            command.done.wait(timeout)
+        return command
+
+    def stats(self):
+        with self._lock:
+            by_status = {}
+            for command in self._commands.values():
+                by_status[command.status] = by_status.get(command.status, 0) + 1
+            return {
+                "commands": by_status,
+                "busy_devices": len(self._running),
+                "pending": sum(len(q) for q in self._pending.values())
+            }
+
+
+command_queue = CommandQueue()
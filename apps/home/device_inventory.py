@@ -0,0 +1,144 @@
+# -*- encoding: utf-8 -*-
+"""
+Danh mục device cục bộ (bảng 'devices' + 'device_labels'), bản sao của core-metadata.
+
+Làm mới tăng dần: danh sách /device/all được duyệt theo trang, chỉ những device có
+'modified' khác bản đã lưu mới được ghi lại; device không còn trên EdgeX bị xóa.
+Mỗi process làm mới tối đa một lần mỗi INVENTORY_REFRESH_INTERVAL giây, nên việc liệt kê /
+tìm kiếm chỉ là truy vấn trên index (name, label, profile, service) thay vì quét core-metadata.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+from apps import db
+from . import edgex_interface as edgex
+from .models import Devices, DeviceLabels
+
+INVENTORY_REFRESH_INTERVAL = float(os.getenv("DEVICE_INVENTORY_REFRESH", 60))  # Giây
+INVENTORY_PAGE_SIZE = 50
+INVENTORY_MAX_PAGE_SIZE = 500
+
+_refresh_lock = threading.Lock()
+_last_refresh = None
+
+
+def protocols_hash(protocols):
+    return hashlib.sha1(json.dumps(protocols or {}, sort_keys=True).encode()).hexdigest()
+
+
+def _apply(row, device):
+    row.profile_name = device.get("profileName")
+    row.service_name = device.get("serviceName")
+    row.admin_state = device.get("adminState")
+    row.operating_state = device.get("operatingState")
+    row.labels = json.dumps(device.get("labels") or [])
+    row.protocols_hash = protocols_hash(device.get("protocols"))
+    row.modified = int(device.get("modified") or 0)
+
+
+def refresh():
+    """
+    Đồng bộ bảng devices với core-metadata.
+
+    Returns:
+        dict: số device 'added', 'updated', 'removed', 'unchanged'
+    """
+    # Lỗi giữa chừng (raise từ iter_all_devices hoặc DB) rollback mọi thay đổi đã thêm vào session,
+    # để lần commit sau (của request khác) không ghi một lần làm mới dở dang
+    try:
+        existing = {row.name: row for row in Devices.query.all()}
+        stats = {"added": 0, "updated": 0, "removed": 0, "unchanged": 0}
+        seen = set()
+
+        for device in edgex.iter_all_devices():
+            name = device.get("name")
+            if not name or name in seen:
+                continue
+            seen.add(name)
+
+            row = existing.get(name)
+            if row is not None and row.modified == int(device.get("modified") or 0):
+                stats["unchanged"] += 1
+                continue
+
+            if row is None:
+                row = Devices(name=name)
+                db.session.add(row)
+                stats["added"] += 1
+            else:
+                DeviceLabels.query.filter_by(device_name=name).delete()
+                stats["updated"] += 1
+            _apply(row, device)
+            for label in sorted(set(device.get("labels") or [])):
+                db.session.add(DeviceLabels(device_name=name, label=label))
+
+        removed = [name for name in existing if name not in seen]
+        if removed:
+            DeviceLabels.query.filter(DeviceLabels.device_name.in_(removed)).delete(synchronize_session=False)
+            Devices.query.filter(Devices.name.in_(removed)).delete(synchronize_session=False)
+            stats["removed"] = len(removed)
+
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return stats
+
+
+def ensure_fresh(max_age=INVENTORY_REFRESH_INTERVAL):
+    """Làm mới nếu lần làm mới gần nhất (trong process) cũ hơn max_age giây; lỗi EdgeX chỉ được log."""
+    global _last_refresh
+    if _last_refresh is not None and time.monotonic() - _last_refresh < max_age:
+        return None
+    with _refresh_lock:
+        if _last_refresh is not None and time.monotonic() - _last_refresh < max_age:
+            return None
+        try:
+            stats = refresh()
+        except Exception as e:
+            logging.error(f"Device inventory refresh error: {e}")
+            stats = None
+        # Kể cả khi lỗi: không để mọi request sau đó đều gọi lại core-metadata
+        _last_refresh = time.monotonic()
+        return stats
+
+
+def search(q=None, label=None, farms=None, profile=None, service=None, offset=0, limit=INVENTORY_PAGE_SIZE):
+    """
+    Tìm device trong danh mục cục bộ.
+
+    Args:
+        q (str): chuỗi con của tên device.
+        label (str): nhãn device phải có.
+        farms (list): chỉ các device có tên trùng tên farm trong danh sách.
+
+    Returns:
+        dict: {"total": int, "devices": [dict]}
+    """
+    query = Devices.query
+    if q:
+        query = query.filter(Devices.name.ilike(f"%{q}%"))
+    if label:
+        query = query.join(DeviceLabels, DeviceLabels.device_name == Devices.name).filter(DeviceLabels.label == label)
+    if farms is not None:
+        query = query.filter(Devices.name.in_(list(farms)))
+    if profile:
+        query = query.filter(Devices.profile_name == profile)
+    if service:
+        query = query.filter(Devices.service_name == service)
+
+    limit = max(1, min(int(limit), INVENTORY_MAX_PAGE_SIZE))
+    total = query.count()
+    rows = query.order_by(Devices.name.asc()).offset(max(int(offset), 0)).limit(limit).all()
+    return {"total": total, "devices": [row.to_dict() for row in rows]}
+
+
+def get(name):
+    """Device theo tên trong danh mục cục bộ (dict), hoặc None."""
+    row = Devices.query.filter_by(name=name).first()
+    return row.to_dict() if row else None
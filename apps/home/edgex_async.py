@@ -0,0 +1,244 @@
+# -*- encoding: utf-8 -*-
+"""
+EdgeX client bất đồng bộ (asyncio + httpx) với cùng các thao tác như edgex_interface.
+
+- AsyncEdgeXClient: dùng trong coroutine, có pool kết nối + timeout + retry/backoff.
+- edgex_sync: facade đồng bộ cho các route Flask. Event loop chạy trong một luồng nền của
+  process; route chỉ chờ kết quả, còn việc gọi song song nhiều request (fan-out) diễn ra
+  trong event loop với một pool kết nối chung.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+
+import httpx
+
+from .edgex_interface import (
+    CORE_METADATA_URL, CORE_COMMAND_URL, readings_url,
+    HTTP_POOL_SIZE, HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT, HTTP_RETRIES, HTTP_BACKOFF,
+)
+
+RETRY_STATUS = (502, 503, 504)
+
+# httpx log mỗi request ở mức INFO, quá ồn với polling dashboard
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+
+class AsyncEdgeXClient:
+    def __init__(self, pool_size=HTTP_POOL_SIZE, connect_timeout=HTTP_CONNECT_TIMEOUT,
+                 read_timeout=HTTP_READ_TIMEOUT, retries=HTTP_RETRIES, backoff=HTTP_BACKOFF):
+        self.retries = retries
+        self.backoff = backoff
+        self._client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=pool_size * 3, max_keepalive_connections=pool_size * 3),
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+        )
+
+    async def _request(self, method, url, **kwargs):
+        """
+        Gửi request có retry + exponential backoff.
+        Giống session đồng bộ: chỉ GET được retry sau khi đã gửi; PUT/PATCH chỉ retry khi chưa kết nối được.
+        """
+        attempt = 0
+        while True:
+            try:
+                response = await self._client.request(method, url, **kwargs)
+                if method == "GET" and response.status_code in RETRY_STATUS and attempt < self.retries:
+                    raise httpx.HTTPStatusError("retryable status", request=response.request, response=response)
+                response.raise_for_status()
+                return response
+            except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout,
+                    httpx.ReadTimeout, httpx.RemoteProtocolError, httpx.HTTPStatusError) as e:
+                can_retry = isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)) or method == "GET"
+                if isinstance(e, httpx.HTTPStatusError) and e.response.status_code not in RETRY_STATUS:
+                    can_retry = False
+                if not can_retry or attempt >= self.retries:
+                    raise
+                await asyncio.sleep(self.backoff * (2 ** attempt))
+                attempt += 1
+
+    async def aclose(self):
+        await self._client.aclose()
+
+    # ==== DEVICE & COMMAND ====
+
+    async def get_all_devices(self):
+        try:
+            response = await self._request("GET", f"{CORE_METADATA_URL}/api/v3/device/all")
+            return response.json().get("devices", [])
+        except Exception as e:
+            print("Error fetching devices:", e)
+            return []
+
+    async def get_device_by_name(self, name):
+        try:
+            response = await self._request("GET", f"{CORE_METADATA_URL}/api/v3/device/name/{name}")
+            return response.json().get("device", {})
+        except Exception as e:
+            print("Error fetching device:", e)
+            return {}
+
+    async def update_device(self, device_info):
+        try:
+            body = {"apiVersion": "v3", 'device': device_info}
+            response = await self._request("PATCH", f"{CORE_METADATA_URL}/api/v3/device", json=[body])
+            return response.json()
+        except Exception as e:
+            print("Error updating device:", e)
+            return {}
+
+    async def send_command(self, device_name, command_name, method="PUT", body=None):
+        try:
+            url = f"{CORE_COMMAND_URL}/api/v3/device/name/{device_name}/{command_name}"
+            if method.upper() == "PUT":
+                response = await self._request("PUT", url, json=body or {})
+            else:
+                response = await self._request("GET", url)
+            return response.json()
+        except Exception as e:
+            print("Error sending command:", e)
+            return {}
+
+    # ==== CORE-DATA (Reading History) ====
+
+    async def fetch_readings(self, device_name, resource_name, start_ms=None, end_ms=None, limit=100, offset=0):
+        """Như get_readings nhưng lỗi HTTP / kết nối được raise."""
+        url = readings_url(device_name, resource_name, start_ms, end_ms)
+        params = {"limit": limit}
+        if offset: params["offset"] = offset
+        response = await self._request("GET", url, params=params)
+        return response.json().get("readings", [])
+
+    async def get_readings(self, device_name, resource_name, start_ms=None, end_ms=None, limit=100, offset=0):
+        try:
+            return await self.fetch_readings(device_name, resource_name, start_ms=start_ms, end_ms=end_ms, limit=limit, offset=offset)
+        except Exception as e:
+            print("Error fetching readings:", e)
+            return []
+
+    async def get_latest_readings(self, device_name, resource_names, strict=False):
+        """
+        Lấy reading mới nhất của nhiều resource song song: {resource_name: reading hoặc None}.
+
+        Resource đọc lỗi cho None. Với strict=True, resource đọc lỗi bị bỏ khỏi kết quả (để bên gọi
+        phân biệt "lỗi" với "không có reading"), và nếu mọi resource đều lỗi (device / core-data
+        không truy cập được) thì raise lỗi đầu tiên.
+        """
+        resource_names = list(resource_names)
+        results = await asyncio.gather(*(self.fetch_readings(device_name, r, limit=1) for r in resource_names),
+                                       return_exceptions=True)
+        errors = [result for result in results if isinstance(result, Exception)]
+        for error in errors:
+            print("Error fetching readings:", error)
+        if strict and errors and len(errors) == len(results):
+            raise errors[0]
+        return {r: (readings[0] if readings and not isinstance(readings, Exception) else None)
+                for r, readings in zip(resource_names, results)
+                if not (strict and isinstance(readings, Exception))}
+
+    async def get_latest_readings_many(self, device_names, resource_names, timeout=None, concurrency=None, total_timeout=None):
+        """
+        Reading mới nhất của nhiều device song song, tối đa `concurrency` device cùng lúc.
+        Mỗi device có hạn `timeout` giây (tính từ lúc bắt đầu gọi), cả lượt có hạn `total_timeout`.
+
+        Returns:
+            dict: {device_name: {resource_name: reading} hoặc exception (asyncio.TimeoutError khi quá hạn,
+                  lỗi HTTP / kết nối khi không đọc được resource nào của device)}
+        """
+        device_names = list(device_names)
+        semaphore = asyncio.Semaphore(concurrency or max(len(device_names), 1))
+
+        async def one(device_name):
+            async with semaphore:
+                return await asyncio.wait_for(self.get_latest_readings(device_name, resource_names, strict=True), timeout)
+
+        tasks = [asyncio.ensure_future(one(d)) for d in device_names]
+        if not tasks:
+            return {}
+        _, pending = await asyncio.wait(tasks, timeout=total_timeout)
+        for task in pending:
+            task.cancel()
+
+        results = {}
+        for device_name, task in zip(device_names, tasks):
+            if task in pending:
+                results[device_name] = asyncio.TimeoutError()
+            elif task.exception() is not None:
+                results[device_name] = task.exception()
+            else:
+                results[device_name] = task.result()
+        return results
+
+
+class EdgeXSync:
+    """
+    Facade đồng bộ quanh AsyncEdgeXClient.
+    Mỗi process (gunicorn worker) có một event loop + client riêng, tạo lại sau khi fork.
+    """
+
+    def __init__(self):
+        self._loop = None
+        self._client = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _ensure_loop(self):
+        pid = os.getpid()
+        if self._loop is not None and self._pid == pid:
+            return
+        with self._lock:
+            if self._loop is not None and self._pid == pid:
+                return
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="edgex-async-loop", daemon=True).start()
+
+            async def create_client():
+                return AsyncEdgeXClient()
+
+            self._client = asyncio.run_coroutine_threadsafe(create_client(), loop).result()
+            self._loop = loop
+            self._pid = pid
+
+    @property
+    def client(self):
+        self._ensure_loop()
+        return self._client
+
+    def run(self, coro, timeout=None):
+        """Chạy một coroutine trên event loop nền và chờ kết quả."""
+        self._ensure_loop()
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result(timeout)
+
+    def gather(self, coros, timeout=None):
+        """Chạy song song nhiều coroutine; lỗi của từng coroutine được trả về như một phần tử kết quả."""
+        async def _gather():
+            return await asyncio.gather(*coros, return_exceptions=True)
+        return self.run(_gather(), timeout)
+
+    def get_all_devices(self):
+        return self.run(self.client.get_all_devices())
+
+    def get_device_by_name(self, name):
+        return self.run(self.client.get_device_by_name(name))
+
+    def update_device(self, device_info):
+        return self.run(self.client.update_device(device_info))
+
+    def send_command(self, device_name, command_name, method="PUT", body=None):
+        return self.run(self.client.send_command(device_name, command_name, method=method, body=body))
+
+    def get_readings(self, device_name, resource_name, start_ms=None, end_ms=None, limit=100, offset=0):
+        return self.run(self.client.get_readings(device_name, resource_name, start_ms=start_ms, end_ms=end_ms, limit=limit, offset=offset))
+
+    def get_latest_readings(self, device_name, resource_names, strict=False):
+        return self.run(self.client.get_latest_readings(device_name, resource_names, strict=strict))
+
+    def get_latest_readings_many(self, device_names, resource_names, timeout=None, concurrency=None, total_timeout=None):
+        return self.run(self.client.get_latest_readings_many(
+            device_names, resource_names, timeout=timeout, concurrency=concurrency, total_timeout=total_timeout
+        ))
+
+
+edgex_sync = EdgeXSync()
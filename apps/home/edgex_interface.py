@@ -1,10 +1,15 @@
 from dotenv import load_dotenv
 import os
+import copy
 import requests
+import threading
 import time
 from datetime import datetime, timedelta, date
-from bitstring import BitArray
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
+from contextlib import contextmanager
 
 
 # Load environment variables from .env file
@@ -16,30 +21,149 @@ CORE_COMMAND_URL  = os.getenv("CORE_COMMAND_URL")
 CORE_DATA_URL     = os.getenv("CORE_DATA_URL")
 RULE_ENGINE_URL   = os.getenv("RULE_ENGINE_URL")
 
+# ==== HTTP session (keep-alive + connection pool) ====
+
+HTTP_POOL_SIZE       = int(os.getenv("EDGEX_POOL_SIZE", 10))       # Số kết nối giữ lại cho mỗi host
+HTTP_CONNECT_TIMEOUT = float(os.getenv("EDGEX_CONNECT_TIMEOUT", 3))  # Giây
+HTTP_READ_TIMEOUT    = float(os.getenv("EDGEX_READ_TIMEOUT", 10))    # Giây
+HTTP_RETRIES         = int(os.getenv("EDGEX_RETRIES", 3))
+HTTP_BACKOFF         = float(os.getenv("EDGEX_BACKOFF", 0.3))        # 0.3s, 0.6s, 1.2s...
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+
+def _build_session():
+    """
+    Tạo một requests.Session dùng chung với pool kết nối riêng cho từng host
+    (core-metadata, core-command, core-data).
+
+    Chỉ retry lại GET khi lỗi đọc hoặc gặp 502/503/504; PUT/PATCH chỉ được retry
+    khi chưa kết nối được tới server để tránh gửi lệnh điều khiển hai lần.
+    """
+    retry = Retry(
+        total=HTTP_RETRIES,
+        backoff_factor=HTTP_BACKOFF,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset({"GET"}),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=8, pool_maxsize=HTTP_POOL_SIZE, max_retries=retry)
+
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def get_session():
+    """
+    Trả về session dùng chung của process hiện tại.
+    Session được tạo lại sau khi fork (mỗi gunicorn worker có pool riêng).
+    """
+    global _session, _session_pid
+    pid = os.getpid()
+    if _session is None or _session_pid != pid:
+        with _session_lock:
+            if _session is None or _session_pid != pid:
+                _session = _build_session()
+                _session_pid = pid
+    return _session
+
+
+def _request(method, url, **kwargs):
+    """Gửi HTTP request qua session dùng chung, có timeout mặc định."""
+    kwargs.setdefault("timeout", (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT))
+    return get_session().request(method, url, **kwargs)
+
 
 # ==== DEVICE & COMMAND ====
 
+DEVICE_PAGE_SIZE = int(os.getenv("EDGEX_DEVICE_PAGE_SIZE", 200))
+
+def iter_all_devices(page_size=DEVICE_PAGE_SIZE):
+    """
+    Duyệt toàn bộ device của core-metadata theo từng trang (offset / limit).
+    Khác get_all_devices(): lỗi HTTP được raise để bên gọi biết danh sách không đầy đủ.
+    """
+    url = f"{CORE_METADATA_URL}/api/v3/device/all"
+    offset = 0
+    while True:
+        response = _request("GET", url, params={"offset": offset, "limit": page_size})
+        response.raise_for_status()
+        devices = response.json().get("devices") or []
+        yield from devices
+        if len(devices) < page_size:
+            return
+        offset += len(devices)
+
+
 def get_all_devices():
     try:
-        url = f"{CORE_METADATA_URL}/api/v3/device/all"
-        response = requests.get(url)
-        response.raise_for_status()
-        return response.json().get("devices", [])
+        return list(iter_all_devices())
     except Exception as e:
         print("Error fetching devices:", e)
         return []
 
-def get_device_by_name(name):
+# ==== Device metadata cache ====
+# Rule và các route đọc metadata của cùng một device nhiều lần trong một thao tác; cache theo tên
+# device, hết hạn sau DEVICE_CACHE_TTL giây và bị xóa ngay sau mỗi update_device thành công.
+
+DEVICE_CACHE_TTL = float(os.getenv("EDGEX_DEVICE_CACHE_TTL", 30))  # Giây
+
+_device_cache = {}  # name -> {"device": dict, "checked_at": float}
+_device_cache_lock = threading.Lock()
+_device_cache_stats = {"hits": 0, "misses": 0}
+
+
+def invalidate_device(name=None):
+    """Xóa metadata đã cache của một device (hoặc toàn bộ nếu name=None)."""
+    with _device_cache_lock:
+        if name is None:
+            _device_cache.clear()
+        else:
+            _device_cache.pop(name, None)
+
+
+def device_cache_stats():
+    with _device_cache_lock:
+        return dict(_device_cache_stats, size=len(_device_cache), ttl=DEVICE_CACHE_TTL)
+
+
+def _fetch_device(name):
     try:
         url = f"{CORE_METADATA_URL}/api/v3/device/name/{name}"
         print(f"Fetching device: {url}")
-        response = requests.get(url)
+        response = _request("GET", url)
         response.raise_for_status()
         return response.json().get("device", {})
     except Exception as e:
         print("Error fetching device:", e)
         return {}
 
+
+def get_device_by_name(name, use_cache=True):
+    """
+    Lấy metadata của device, qua cache.
+    Trả về bản sao (deepcopy) nên người gọi có thể sửa tự do mà không làm hỏng cache.
+    """
+    if use_cache:
+        with _device_cache_lock:
+            entry = _device_cache.get(name)
+            if entry and time.monotonic() - entry["checked_at"] < DEVICE_CACHE_TTL:
+                _device_cache_stats["hits"] += 1
+                return copy.deepcopy(entry["device"])
+
+    device = _fetch_device(name)
+    if not device:
+        return {}
+
+    with _device_cache_lock:
+        _device_cache_stats["misses"] += 1
+        _device_cache[name] = {"device": device, "checked_at": time.monotonic()}
+    return copy.deepcopy(device)
+
 def update_device(device_info):
     """
     Partially update a device in EdgeX core-metadata.
@@ -52,8 +176,9 @@ def update_device(device_info):
     try:
         url = f"{CORE_METADATA_URL}/api/v3/device"
         body = {"apiVersion": "v3", 'device': device_info}
-        response = requests.patch(url, json=[body])  # API yêu cầu list []
+        response = _request("PATCH", url, json=[body])  # API yêu cầu list []
         response.raise_for_status()
+        invalidate_device(device_info.get("name"))
         return response.json()
     except Exception as e:
         print("Error updating device:", e)
@@ -67,9 +192,9 @@ def send_command(device_name, command_name, method="PUT", body=None):
         url = f"{CORE_COMMAND_URL}/api/v3/device/name/{device_name}/{command_name}"
         print(f"Fetching device: {url}")
         if method.upper() == "PUT":
-            response = requests.put(url, json=body or {})
+            response = _request("PUT", url, json=body or {})
         else:
-            response = requests.get(url)
+            response = _request("GET", url)
         response.raise_for_status()
         return response.json()
     except Exception as e:
@@ -79,25 +204,85 @@ def send_command(device_name, command_name, method="PUT", body=None):
 
 # ==== CORE-DATA (Reading History) ====
 
-def get_readings(device_name, resource_name, start_ms=None, end_ms=None, limit=100):
+def readings_url(device_name, resource_name, start_ms=None, end_ms=None):
     """
-    Truy vấn readings theo thiết bị + resource trong khoảng thời gian
+    URL truy vấn readings. Core-data chỉ lọc theo thời gian qua route /start/{start}/end/{end}
+    (đơn vị nano giây, cùng đơn vị với trường 'origin'); query param start/end bị bỏ qua.
     """
-    try:
-        url = f"{CORE_DATA_URL}/api/v3/reading/device/name/{device_name}/resourceName/{resource_name}"
-        params = {"limit": limit}
-        if start_ms: params["start"] = start_ms
-        if end_ms: params["end"] = end_ms
+    url = f"{CORE_DATA_URL}/api/v3/reading/device/name/{device_name}/resourceName/{resource_name}"
+    if start_ms or end_ms:
+        start_ns = int(start_ms or 0) * 1_000_000
+        end_ns = int(end_ms or now_ms()) * 1_000_000
+        url += f"/start/{start_ns}/end/{end_ns}"
+    return url
+
+def fetch_readings(device_name, resource_name, start_ms=None, end_ms=None, limit=100, offset=0):
+    """
+    Như get_readings nhưng lỗi HTTP / kết nối được raise, để bên gọi phân biệt
+    "không có reading" với "không lấy được reading".
+    """
+    url = readings_url(device_name, resource_name, start_ms, end_ms)
+    params = {"limit": limit}
+    if offset: params["offset"] = offset
 
-        # print(f"Fetching device: {url}")
+    response = _request("GET", url, params=params)
+    response.raise_for_status()
+    return response.json().get("readings", [])
 
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        return response.json().get("readings", [])
+def get_readings(device_name, resource_name, start_ms=None, end_ms=None, limit=100, offset=0):
+    """
+    Truy vấn readings theo thiết bị + resource trong khoảng thời gian (mới nhất trước)
+    """
+    try:
+        return fetch_readings(device_name, resource_name, start_ms=start_ms, end_ms=end_ms, limit=limit, offset=offset)
     except Exception as e:
         print("Error fetching readings:", e)
         return []
 
+def iter_readings(device_name, resource_name, start_ms=None, end_ms=None, page_size=1000, prefetch=False):
+    """
+    Duyệt lười toàn bộ readings trong khoảng thời gian (mới nhất trước), đi qua từng trang
+    bằng offset cho tới khi hết, thay vì bị cắt ở `limit` như get_readings.
+
+    Args:
+        end_ms: mốc cuối được cố định ngay từ đầu (mặc định: bây giờ) để reading mới đến
+                trong lúc duyệt không làm lệch offset.
+        prefetch (bool): tải trước trang kế tiếp ở luồng nền trong khi trang hiện tại đang được xử lý.
+
+    Yields:
+        dict: từng reading của EdgeX.
+
+    Raises:
+        requests.RequestException: khi một trang không tải được (kể cả trang tải trước), để bên
+        gọi không nhầm một trang lỗi với trang cuối.
+    """
+    start_ms = start_ms or 0
+    end_ms = end_ms or now_ms()
+
+    def fetch(offset):
+        return fetch_readings(device_name, resource_name, start_ms=start_ms, end_ms=end_ms, limit=page_size, offset=offset)
+
+    if not prefetch:
+        offset = 0
+        while True:
+            page = fetch(offset)
+            yield from page
+            if len(page) < page_size:
+                return
+            offset += page_size
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        offset = 0
+        pending = executor.submit(fetch, offset)
+        while True:
+            page = pending.result()
+            if len(page) == page_size:
+                offset += page_size
+                pending = executor.submit(fetch, offset)
+            yield from page
+            if len(page) < page_size:
+                return
+
 # ==== (Optional) Epoch helper ====
 
 def now_ms():
@@ -150,22 +335,291 @@ def convert_days_to_date(days_since_2025):
     # Trả về chuỗi ngày đã được định dạng
     return result_date.isoformat()
 
+# ==== Mã hóa rule 16-byte ====
+
+# Bố cục bit của một rule (big-endian, tổng 128 bit), theo thứ tự từ bit cao nhất
+RULE_LAYOUT = (
+    ("id", 5),
+    ("repeat_days", 5),
+    ("start_in_minutes", 11),
+    ("end_in_minutes", 11),
+    ("start_date", 16),        # Số ngày tính từ 01/01/2025
+    ("relay_index", 3),
+    ("relay_value", 1),
+    ("reverse_on_false", 1),
+    ("logic", 3),
+    ("temp_min", 10),          # int(nhiệt độ * 10) + 200
+    ("temp_max", 10),
+    ("hum_min", 10),
+    ("hum_max", 10),
+    ("light_min", 16),
+    ("light_max", 16),
+)
+RULE_SIZE = 16  # Byte
+
+RULE_TEMP_MIN = -20.0
+RULE_TEMP_MAX = 80.0
+RULE_HUM_MIN = 0
+RULE_HUM_MAX = 100
+RULE_LIGHT_MIN = 0
+RULE_LIGHT_MAX = 65535
+
+
+def _clamp(value, lo, hi):
+    return max(lo, min(hi, value))
+
+
+def rule_fields(rule):
+    """
+    Kiểm tra một rule và chuyển sang giá trị nguyên của từng trường trong RULE_LAYOUT
+    (nhiệt độ / độ ẩm / ánh sáng được kẹp vào khoảng hợp lệ trước).
+
+    Raises:
+        ValueError: nếu có trường nằm ngoài phạm vi.
+    """
+    temp_min_val = _clamp(rule["temp_min"], RULE_TEMP_MIN, RULE_TEMP_MAX)
+    temp_max_val = _clamp(rule["temp_max"], RULE_TEMP_MIN, RULE_TEMP_MAX)
+    encoded_temp_min = int(temp_min_val * 10) + 200
+    encoded_temp_max = int(temp_max_val * 10) + 200
+
+    hum_min_val = int(_clamp(rule["hum_min"], RULE_HUM_MIN, RULE_HUM_MAX))
+    hum_max_val = int(_clamp(rule["hum_max"], RULE_HUM_MIN, RULE_HUM_MAX))
+
+    light_min_val = int(_clamp(rule["light_min"], RULE_LIGHT_MIN, RULE_LIGHT_MAX))
+    light_max_val = int(_clamp(rule["light_max"], RULE_LIGHT_MIN, RULE_LIGHT_MAX))
+
+    start_date_since_2025 = calculate_days_since_2025(rule["start_date"])
+    if start_date_since_2025 is None or start_date_since_2025 < 0 or start_date_since_2025 > 65535:
+        raise ValueError("Lỗi mã hóa: Ngày bắt đầu không hợp lệ hoặc ngoài phạm vi.")
+    if rule['id'] < 0 or rule['id'] >= 32:
+        raise ValueError("Lỗi mã hóa: ID rule phải trong khoảng 0-31.")
+    if rule['repeat_days'] < 0 or rule['repeat_days'] >= 32:
+        raise ValueError("Lỗi mã hóa: repeat_days phải trong khoảng 0-31.")
+    if rule['start_in_minutes'] < 0 or rule['start_in_minutes'] >= 1440:
+        raise ValueError("Lỗi mã hóa: start_in_minutes phải trong khoảng 0-1439.")
+    if rule['end_in_minutes'] < 0 or rule['end_in_minutes'] >= 1440:
+        raise ValueError("Lỗi mã hóa: end_in_minutes phải trong khoảng 0-1439.")
+    if rule['relay_index'] < 0 or rule['relay_index'] >= 8:
+        raise ValueError("Lỗi mã hóa: relay_index phải trong khoảng 0-7.")
+    if rule['logic'] < 0 or rule['logic'] >= 8:
+        raise ValueError("Lỗi mã hóa: logic phải trong khoảng 0-7.")
+    if encoded_temp_min < 0 or encoded_temp_min >= 1024:
+        raise ValueError("Lỗi mã hóa: temp_min ngoài phạm vi.")
+    if encoded_temp_max < 0 or encoded_temp_max >= 1024:
+        raise ValueError("Lỗi mã hóa: temp_max ngoài phạm vi.")
+
+    return {
+        "id": int(rule["id"]),
+        "repeat_days": int(rule["repeat_days"]),
+        "start_in_minutes": int(rule["start_in_minutes"]),
+        "end_in_minutes": int(rule["end_in_minutes"]),
+        "start_date": start_date_since_2025,
+        "relay_index": int(rule["relay_index"]),
+        "relay_value": 1 if rule["relay_value"] else 0,
+        "reverse_on_false": 1 if rule["reverse_on_false"] else 0,
+        "logic": int(rule["logic"]),
+        "temp_min": encoded_temp_min,
+        "temp_max": encoded_temp_max,
+        "hum_min": hum_min_val,
+        "hum_max": hum_max_val,
+        "light_min": light_min_val,
+        "light_max": light_max_val,
+    }
+
+
+def encode_rule(rule):
+    """
+    Mã hóa một rule (dict) thành gói tin 16 byte: các trường được ghép vào một số nguyên
+    128 bit bằng shift / OR theo RULE_LAYOUT rồi chuyển sang bytes big-endian.
+    """
+    fields = rule_fields(rule)
+    value = 0
+    for name, bits in RULE_LAYOUT:
+        value = (value << bits) | fields[name]
+    return value.to_bytes(RULE_SIZE, "big")
+
+
+def decode_rule(payload_bytes):
+    """
+    Giải mã gói tin 16 byte thành rule (dict), là phép ngược của encode_rule
+    (nhiệt độ về độ C, start_date về 'yyyy-mm-dd', relay_value / reverse_on_false về bool).
+    """
+    if len(payload_bytes) != RULE_SIZE:
+        raise ValueError("Payload phải có đúng 16 byte.")
+
+    value = int.from_bytes(payload_bytes, "big")
+    rule = {}
+    for name, bits in reversed(RULE_LAYOUT):
+        rule[name] = value & ((1 << bits) - 1)
+        value >>= bits
+    rule = {name: rule[name] for name, _ in RULE_LAYOUT}
+
+    rule["relay_value"] = bool(rule["relay_value"])
+    rule["reverse_on_false"] = bool(rule["reverse_on_false"])
+    rule["temp_min"] = (rule["temp_min"] - 200) / 10.0
+    rule["temp_max"] = (rule["temp_max"] - 200) / 10.0
+    rule["start_date"] = convert_days_to_date(rule["start_date"])
+    return rule
+
+
+def encode_rules(rules):
+    """Mã hóa nhiều rule thành một buffer liền (16 byte mỗi rule, theo thứ tự)."""
+    return b"".join(encode_rule(rule) for rule in rules)
+
+
+def decode_rules(buffer):
+    """Giải mã buffer gồm nhiều gói tin 16 byte liền nhau. Returns: list rule."""
+    if len(buffer) % RULE_SIZE:
+        raise ValueError("Độ dài buffer phải là bội số của 16 byte.")
+    return [decode_rule(buffer[i:i + RULE_SIZE]) for i in range(0, len(buffer), RULE_SIZE)]
+
+
 # ==== Quản lý danh sách rule cục bộ ====
+class RuleRepository:
+    """
+    Danh sách rule của một device (lưu trong protocols["Rules"]["rules"] của core-metadata).
+
+    - Nạp từ metadata một lần (lười) rồi giữ trong bộ nhớ cho cả phạm vi request.
+    - add / delete / clear chỉ sửa bản trong bộ nhớ; save() ghi metadata bằng đúng một PATCH.
+    - batch(): gom nhiều thay đổi, ghi một lần khi ra khỏi khối `with`.
+    """
+
+    def __init__(self, device_name):
+        self.device_name = device_name
+        self._rules = None
+        self._dirty = False
+        self._batch_depth = 0
+
+    def _load(self):
+        if self._rules is not None:
+            return self._rules
+        try:
+            device_info = get_device_by_name(self.device_name)
+            if not device_info:
+                print(f"Không tìm thấy thiết bị với tên '{self.device_name}'.")
+                self._rules = []
+                return self._rules
+
+            rules = device_info.get("protocols", {}).get("Rules", {}).get("rules", [])
+            if not rules:
+                print(f"Không có rule nào được định nghĩa cho thiết bị '{self.device_name}'.")
+            self._rules = list(rules)
+        except Exception as e:
+            print(f"Lỗi khi lấy danh sách rule cho thiết bị '{self.device_name}': {e}")
+            self._rules = []
+        return self._rules
+
+    def reload(self):
+        """Bỏ bản trong bộ nhớ, lần đọc sau sẽ nạp lại từ metadata."""
+        self._rules = None
+        self._dirty = False
+
+    def list(self):
+        return self._load()
+
+    def get(self, rule_id):
+        return next((rule for rule in self._load() if rule.get("id") == rule_id), None)
+
+    def add(self, new_rule):
+        """Thêm mới hoặc cập nhật rule cùng ID. Returns: True nếu là cập nhật."""
+        rules = self._load()
+        self._dirty = True
+        for i, rule in enumerate(rules):
+            if rule.get("id") == new_rule["id"]:
+                rules[i] = new_rule
+                return True
+        rules.append(new_rule)
+        return False
+
+    def delete(self, rule_id):
+        """Returns: True nếu có rule bị xóa."""
+        rules = self._load()
+        remaining = [rule for rule in rules if rule.get("id") != rule_id]
+        if len(remaining) == len(rules):
+            return False
+        rules[:] = remaining
+        self._dirty = True
+        return True
+
+    def clear(self):
+        self._load()[:] = []
+        self._dirty = True
+
+    def save(self):
+        """
+        Ghi danh sách rule vào metadata (một PATCH). Không làm gì nếu không có thay đổi.
+
+        Returns:
+            dict: {"success": bool, ...}
+        """
+        if not self._dirty:
+            return {"success": True}
+        try:
+            # PATCH thay cả map 'protocols': đọc thẳng core-metadata (bỏ qua cache) ngay trước khi ghi
+            # để không ghi đè thay đổi của protocol khác trong thời gian cache còn hạn
+            device_info = get_device_by_name(self.device_name, use_cache=False)
+            if not device_info:
+                print(f"Không tìm thấy thiết bị với tên '{self.device_name}'.")
+                return {"success": False, "error": "Device not found"}
+
+            protocols = device_info.get("protocols", {})
+            protocols["Rules"] = {"rules": self._load()}
+            device_info["protocols"] = protocols
+
+            if update_device({"name": self.device_name, "protocols": protocols}) == {}:
+                print(f"Lỗi khi cập nhật thiết bị '{self.device_name}'.")
+                return {"success": False, "error": "Failed to update device"}
+
+            self._dirty = False
+            print(f"Đã cập nhật rules cho thiết bị '{self.device_name}'.")
+            return {"success": True, "device": device_info}
+
+        except Exception as e:
+            print(f"Lỗi khi lưu danh sách rules cho thiết bị '{self.device_name}': {e}")
+            return {"success": False, "error": str(e)}
+
+    @contextmanager
+    def batch(self):
+        """
+        Gom các thay đổi; metadata được ghi một lần khi thoát khối ngoài cùng.
+        Kết quả ghi nằm ở self.last_save_result.
+        """
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if self._batch_depth == 0:
+                self.last_save_result = self.save()
+
+    @property
+    def in_batch(self):
+        return self._batch_depth > 0
+
+
 class Rule:
-    TEMP_MIN = -20.0
-    TEMP_MAX = 80.0
-    HUM_MIN = 0
-    HUM_MAX = 100
-    LIGHT_MIN = 0
-    LIGHT_MAX = 65535
+    TEMP_MIN = RULE_TEMP_MIN
+    TEMP_MAX = RULE_TEMP_MAX
+    HUM_MIN = RULE_HUM_MIN
+    HUM_MAX = RULE_HUM_MAX
+    LIGHT_MIN = RULE_LIGHT_MIN
+    LIGHT_MAX = RULE_LIGHT_MAX
     MAX_RULES = 32  # Giới hạn số lượng rule
 
-    def __init__(self, device_name):
+    def __init__(self, device_name, repository=None):
         """
         Khởi tạo class Rule với tên thiết bị và danh sách rule.
+
+        Args:
+            repository (RuleRepository): dùng chung repository (ví dụ trong cùng một request);
+                                         mặc định tạo mới. Danh sách rule được nạp lười.
         """
         self.device_name = device_name
-        self.rule_list = self._get_list()  # Lấy danh sách rule từ thiết bị khi khởi tạo
+        self.repository = repository or RuleRepository(device_name)
+
+    @property
+    def rule_list(self):
+        return self.repository.list()
 
     def _encode(self, rule):
         """
@@ -177,68 +631,7 @@ class Rule:
         Returns:
             bytes: Gói tin 16-byte.
         """
-        s = BitArray()
-
-        temp_min_val = max(self.TEMP_MIN, min(self.TEMP_MAX, rule["temp_min"]))
-        temp_max_val = max(self.TEMP_MIN, min(self.TEMP_MAX, rule["temp_max"]))
-        encoded_temp_min = int(temp_min_val * 10) + 200
-        encoded_temp_max = int(temp_max_val * 10) + 200
-
-        hum_min_val = max(self.HUM_MIN, min(self.HUM_MAX, rule["hum_min"]))
-        hum_max_val = max(self.HUM_MIN, min(self.HUM_MAX, rule["hum_max"]))
-
-        light_min_val = max(self.LIGHT_MIN, min(self.LIGHT_MAX, rule["light_min"]))
-        light_max_val = max(self.LIGHT_MIN, min(self.LIGHT_MAX, rule["light_max"]))
-
-        start_date_since_2025 = calculate_days_since_2025(rule["start_date"])
-        if start_date_since_2025 is None or start_date_since_2025 < 0 or start_date_since_2025 > 65535:
-            raise ValueError("Lỗi mã hóa: Ngày bắt đầu không hợp lệ hoặc ngoài phạm vi.")
-        if rule['id'] < 0 or rule['id'] >= 32:
-            raise ValueError("Lỗi mã hóa: ID rule phải trong khoảng 0-31.")
-        if rule['repeat_days'] < 0 or rule['repeat_days'] >= 32:
-            raise ValueError("Lỗi mã hóa: repeat_days phải trong khoảng 0-31.")
-        if rule['start_in_minutes'] < 0 or rule['start_in_minutes'] >= 1440:
-            raise ValueError("Lỗi mã hóa: start_in_minutes phải trong khoảng 0-1439.")
-        if rule['end_in_minutes'] < 0 or rule['end_in_minutes'] >= 1440:
-            raise ValueError("Lỗi mã hóa: end_in_minutes phải trong khoảng 0-1439.")
-        if rule['relay_index'] < 0 or rule['relay_index'] >= 8:
-            raise ValueError("Lỗi mã hóa: relay_index phải trong khoảng 0-7.")
-        if rule['logic'] < 0 or rule['logic'] >= 8:
-            raise ValueError("Lỗi mã hóa: logic phải trong khoảng 0-7.")
-        if encoded_temp_min < 0 or encoded_temp_min >= 1024:
-            raise ValueError("Lỗi mã hóa: temp_min ngoài phạm vi.")
-        if encoded_temp_max < 0 or encoded_temp_max >= 1024:
-            raise ValueError("Lỗi mã hóa: temp_max ngoài phạm vi.")
-        if hum_min_val < 0 or hum_min_val >= 1024:
-            raise ValueError("Lỗi mã hóa: hum_min ngoài phạm vi.")
-        if hum_max_val < 0 or hum_max_val >= 1024:
-            raise ValueError("Lỗi mã hóa: hum_max ngoài phạm vi.")
-        if light_min_val < 0 or light_min_val >= 65536:
-            raise ValueError("Lỗi mã hóa: light_min ngoài phạm vi.")
-        if light_max_val < 0 or light_max_val >= 65536:
-            raise ValueError("Lỗi mã hóa: light_max ngoài phạm vi.")
-        
-
-        s.append('uint:5={}'.format(rule['id']))
-        s.append('uint:5={}'.format(rule['repeat_days']))
-        s.append('uint:11={}'.format(rule['start_in_minutes']))
-        s.append('uint:11={}'.format(rule['end_in_minutes']))
-        s.append('uint:16={}'.format(start_date_since_2025))
-        s.append('uint:3={}'.format(rule['relay_index']))
-        s.append('bool:1={}'.format(rule['relay_value']))
-        s.append('bool:1={}'.format(rule['reverse_on_false']))
-        s.append('uint:3={}'.format(rule['logic']))
-        s.append('uint:10={}'.format(encoded_temp_min))
-        s.append('uint:10={}'.format(encoded_temp_max))
-        s.append('uint:10={}'.format(hum_min_val))
-        s.append('uint:10={}'.format(hum_max_val))
-        s.append('uint:16={}'.format(light_min_val))
-        s.append('uint:16={}'.format(light_max_val))
-
-        if s.length != 128:
-            raise ValueError("Lỗi mã hóa: Kích thước bit không đúng.")
-
-        return s.bytes
+        return encode_rule(rule)
 
     def _decode(self, payload_bytes):
         """
@@ -250,98 +643,29 @@ class Rule:
         Returns:
             dict: Rule đã giải mã.
         """
-        if len(payload_bytes) != 16:
-            raise ValueError("Payload phải có đúng 16 byte.")
-
-        s = ConstBitStream(payload_bytes)
-
-        rule = {
-            "id": s.read('uint:5'),
-            "repeat_days": s.read('uint:5'),
-            "start_in_minutes": s.read('uint:11'),
-            "end_in_minutes": s.read('uint:11'),
-            "start_date": s.read('uint:16'),
-            "relay_index": s.read('uint:3'),
-            "relay_value": s.read('bool:1'),
-            "reverse_on_false": s.read('bool:1'),
-            "logic": s.read('uint:3'),
-            "temp_min": s.read('uint:10'),
-            "temp_max": s.read('uint:10'),
-            "hum_min": s.read('uint:10'),
-            "hum_max": s.read('uint:10'),
-            "light_min": s.read('uint:16'),
-            "light_max": s.read('uint:16')
-        }
-
-        rule["temp_min"] = (rule["temp_min"] - 200) / 10.0
-        rule["temp_max"] = (rule["temp_max"] - 200) / 10.0
-        rule["hum_min"] = rule["hum_min"] / 10.0
-        rule["hum_max"] = rule["hum_max"] / 10.0
-
-        rule["start_date"] = convert_days_to_date(rule["start_date"])
-
-        return rule
+        return decode_rule(payload_bytes)
 
     def _get_list(self):
         """
-        Lấy danh sách các rule từ trường 'protocols' của thiết bị.
+        Nạp lại danh sách các rule từ trường 'protocols' của thiết bị.
 
         Returns:
             list: Danh sách các rule (nếu có), hoặc một danh sách rỗng nếu không tìm thấy.
         """
-        try:
-            device_info = get_device_by_name(self.device_name)
-            if not device_info:
-                print(f"Không tìm thấy thiết bị với tên '{self.device_name}'.")
-                return []
-
-            print(f"Device info: {device_info}")
-            protocols = device_info.get("protocols", {})
-            rules_root = protocols.get("Rules", {})
-            rules = rules_root.get("rules", [])
-
-            if not rules:
-                print(f"Không có rule nào được định nghĩa cho thiết bị '{self.device_name}'.")
-                return []
-
-            return rules
-
-        except Exception as e:
-            print(f"Lỗi khi lấy danh sách rule cho thiết bị '{self.device_name}': {e}")
-            return []
+        self.repository.reload()
+        return self.repository.list()
 
     def _save(self):
         """
         Cập nhật danh sách rules vào trường 'rules' trong protocols của thiết bị.
+        Trong repository.batch() việc ghi được hoãn tới cuối batch.
 
         Returns:
             dict: Thông tin phản hồi từ meta service hoặc thông báo lỗi.
         """
-        try:
-            device_info = get_device_by_name(self.device_name)
-            if not device_info:
-                print(f"Không tìm thấy thiết bị với tên '{self.device_name}'.")
-                return {"success": False, "error": "Device not found"}
-
-            protocols = device_info.get("protocols", {})
-            protocols["Rules"] = {"rules": self.rule_list}  # Đảm bảo chuyển đổi đúng định dạng
-            device_info["protocols"] = protocols
-
-            new_device_info = {
-                "name": self.device_name,
-                "protocols": device_info.get("protocols", {})
-            }
-
-            if update_device(new_device_info) == {}:
-                print(f"Lỗi khi cập nhật thiết bị '{self.device_name}'.")
-                return {"success": False, "error": "Failed to update device"}
-
-            print(f"Đã cập nhật rules cho thiết bị '{self.device_name}'.")
-            return {"success": True, "device": device_info}
-
-        except Exception as e:
-            print(f"Lỗi khi lưu danh sách rules cho thiết bị '{self.device_name}': {e}")
-            return {"success": False, "error": str(e)}
+        if self.repository.in_batch:
+            return {"success": True}
+        return self.repository.save()
 
     def _add_or_update(self, new_rule):
         """
@@ -358,17 +682,9 @@ class Rule:
             return
 
         rule_id = new_rule["id"]
-        is_updated = False
-
-        for i, rule in enumerate(self.rule_list):
-            if rule.get("id") == rule_id:
-                self.rule_list[i] = new_rule
-                is_updated = True
-                print(f"Rule có ID {rule_id} đã được cập nhật.")
-                break
-
-        if not is_updated:
-            self.rule_list.append(new_rule)
+        if self.repository.add(new_rule):
+            print(f"Rule có ID {rule_id} đã được cập nhật.")
+        else:
             print(f"Đã thêm rule mới với ID {rule_id}.")
 
     def _delete_by_id(self, rule_id):
@@ -381,10 +697,7 @@ class Rule:
         Returns:
             None
         """
-        initial_len = len(self.rule_list)
-        self.rule_list = [rule for rule in self.rule_list if rule.get("id") != rule_id]
-
-        if len(self.rule_list) < initial_len:
+        if self.repository.delete(rule_id):
             print(f"Đã xóa rule có ID {rule_id}.")
         else:
             print(f"Không tìm thấy rule có ID {rule_id}.")
@@ -396,7 +709,7 @@ class Rule:
         Returns:
             None
         """
-        self.rule_list = []
+        self.repository.clear()
         print("Đã xóa tất cả các rule.")
     
     def get_rules(self):
@@ -406,9 +719,28 @@ class Rule:
         Returns:
             list: Danh sách các rule.
         """
-        self._get_list()
         return self.rule_list
 
+    def _send_set_rule(self, payload):
+        """Gửi payload 16-byte của một rule tới core-command (resource "SetRule")."""
+        resource_name = "SetRule"
+        body = {resource_name: ",".join(str(b) for b in payload)}  # Chuyển payload (bytes) thành mảng byte
+        print(body)
+        return send_command(self.device_name, resource_name, method="PUT", body=body)
+
+    def _send_delete_rule(self, rule_id):
+        """Gửi lệnh xóa một rule tới core-command (resource "DeleteRule")."""
+        resource_name = "DeleteRule"
+        return send_command(self.device_name, resource_name, method="PUT", body={resource_name: int(rule_id)})
+
+    @staticmethod
+    def _send_concurrently(calls, max_workers=HTTP_POOL_SIZE):
+        """Chạy song song các lệnh (hàm không tham số) qua pool kết nối chung. Returns: list phản hồi theo thứ tự."""
+        if not calls:
+            return []
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(calls)))) as executor:
+            return list(executor.map(lambda call: call(), calls))
+
     def add_rule(self, rule_json):
         """
         Thêm một rule mới:
@@ -429,10 +761,7 @@ class Rule:
             print(payload)
 
             # 2. Gửi lệnh tới core-command
-            resource_name = "SetRule"
-            body = {resource_name: ",".join(str(b) for b in payload)}  # Chuyển payload (bytes) thành mảng byte
-            print(body)
-            response = send_command(self.device_name, resource_name, method="PUT", body=body)
+            response = self._send_set_rule(payload)
 
             # Kiểm tra HTTP status code
             if response.get("statusCode") != 200:
@@ -455,6 +784,128 @@ class Rule:
             print(f"Lỗi khi thêm rule: {e}")
             return {"success": False, "error": str(e)}
     
+    def add_rules(self, rules_json, max_workers=HTTP_POOL_SIZE):
+        """
+        Thêm nhiều rule trong một lần:
+        1. Encode (kiểm tra) tất cả rule; rule không hợp lệ không được gửi.
+        2. Gửi song song các lệnh "SetRule" tới core-command.
+        3. Cập nhật các rule gửi thành công vào danh sách và lưu metadata đúng một lần.
+
+        Args:
+            rules_json (list): Danh sách rule cần thêm.
+
+        Returns:
+            dict: {"success": bool, "results": [{"id", "success", "error"}], "error": ...}
+        """
+        results = [None] * len(rules_json)
+        encoded = []
+        seen_ids = set()
+        for i, rule_json in enumerate(rules_json):
+            try:
+                if rule_json.get("id") in seen_ids:
+                    raise ValueError(f"ID rule {rule_json.get('id')} bị trùng trong batch.")
+                encoded.append((i, rule_json, self._encode(rule_json)))
+                seen_ids.add(rule_json.get("id"))
+            except Exception as e:
+                results[i] = {"id": rule_json.get("id"), "success": False, "error": str(e)}
+
+        responses = self._send_concurrently([lambda p=payload: self._send_set_rule(p) for _, _, payload in encoded], max_workers)
+
+        with self.repository.batch():
+            for (i, rule_json, _), response in zip(encoded, responses):
+                if response.get("statusCode") != 200:
+                    print(f"Lỗi khi gửi lệnh tới core-command: {response}")
+                    results[i] = {"id": rule_json["id"], "success": False, "error": "Failed to send command to core-command"}
+                    continue
+                self._add_or_update(rule_json)
+                results[i] = {"id": rule_json["id"], "success": True}
+
+        save_result = self.repository.last_save_result
+        if not save_result["success"]:
+            print(f"Lỗi khi lưu danh sách rule vào metadata: {save_result}")
+            return {"success": False, "results": results, "error": "Failed to save rules to metadata"}
+
+        return {"success": all(r["success"] for r in results), "results": results}
+
+    def sync_rules(self, desired_rules, max_workers=HTTP_POOL_SIZE):
+        """
+        Đồng bộ thiết bị về đúng danh sách rule mong muốn, chỉ ghi những slot thay đổi:
+        1. So sánh từng rule mong muốn với bản trong metadata theo ID và payload 16-byte đã mã hóa.
+        2. Gửi "SetRule" cho rule mới / khác payload, "DeleteRule" cho ID không còn trong danh sách
+           (song song); rule giống hệt không gửi gì xuống thiết bị.
+        3. Cập nhật các slot gửi thành công vào danh sách và lưu metadata đúng một lần.
+
+        Args:
+            desired_rules (list): Toàn bộ danh sách rule mong muốn của thiết bị.
+
+        Returns:
+            dict: {"success": bool, "set": [id], "deleted": [id], "unchanged": [id],
+                   "results": [{"id", "action", "success", "error"}], "error": ...}
+        """
+        current = {rule.get("id"): rule for rule in self.rule_list}
+        results, to_set, unchanged = [], [], []
+        desired_ids = set()
+
+        for rule_json in desired_rules:
+            rule_id = rule_json.get("id")
+            try:
+                if rule_id in desired_ids:
+                    raise ValueError(f"ID rule {rule_id} bị trùng trong danh sách.")
+                payload = self._encode(rule_json)
+                desired_ids.add(rule_id)
+            except Exception as e:
+                results.append({"id": rule_id, "action": "set", "success": False, "error": str(e)})
+                continue
+
+            existing = current.get(rule_id)
+            try:
+                same = existing is not None and self._encode(existing) == payload
+            except Exception:
+                same = False  # Bản trong metadata không mã hóa được: ghi lại slot này
+            if same:
+                unchanged.append(rule_id)
+            else:
+                to_set.append((rule_json, payload))
+
+        # Rule mong muốn bị lỗi không làm xóa slot cùng ID đang có trên thiết bị
+        invalid_ids = {r["id"] for r in results}
+        to_delete = [rule_id for rule_id in current if rule_id not in desired_ids and rule_id not in invalid_ids]
+
+        calls = [lambda p=payload: self._send_set_rule(p) for _, payload in to_set]
+        calls += [lambda i=rule_id: self._send_delete_rule(i) for rule_id in to_delete]
+        responses = self._send_concurrently(calls, max_workers)
+
+        done = {"set": [], "deleted": []}
+        with self.repository.batch():
+            actions = [("set", rule_json["id"], rule_json) for rule_json, _ in to_set]
+            actions += [("delete", rule_id, None) for rule_id in to_delete]
+            for (action, rule_id, rule_json), response in zip(actions, responses):
+                if response.get("statusCode") != 200:
+                    print(f"Lỗi khi gửi lệnh tới core-command: {response}")
+                    results.append({"id": rule_id, "action": action, "success": False,
+                                    "error": "Failed to send command to core-command"})
+                    continue
+                if action == "set":
+                    self._add_or_update(rule_json)
+                    done["set"].append(rule_id)
+                else:
+                    self._delete_by_id(rule_id)
+                    done["deleted"].append(rule_id)
+                results.append({"id": rule_id, "action": action, "success": True})
+
+        result = {
+            "success": all(r["success"] for r in results),
+            "set": done["set"],
+            "deleted": done["deleted"],
+            "unchanged": unchanged,
+            "results": results
+        }
+        save_result = self.repository.last_save_result
+        if not save_result["success"]:
+            print(f"Lỗi khi lưu danh sách rule vào metadata: {save_result}")
+            result.update(success=False, error="Failed to save rules to metadata")
+        return result
+
     def delete_rule(self, rule_id):
         """
         Xóa một rule:
@@ -468,9 +919,7 @@ class Rule:
         """
         try:
             # 1. Gửi lệnh tới core-command
-            resource_name = "DeleteRule"
-            body = {resource_name: int(rule_id)}  # Chuyển payload (bytes) thành mảng byte
-            response = send_command(self.device_name, resource_name, method="PUT", body=body)
+            response = self._send_delete_rule(rule_id)
 
             # Kiểm tra HTTP status code
             if response.get("statusCode") != 200:
@@ -0,0 +1,104 @@
+# -*- encoding: utf-8 -*-
+"""
+Copyright (c) 2019 - present AppSeed.us
+"""
+
+import json
+
+from apps import db
+
+
+class Readings(db.Model):
+    """Bản sao cục bộ các reading của core-data (đồng bộ tăng dần theo 'origin')."""
+
+    __tablename__ = 'readings'
+
+    id            = db.Column(db.Integer, primary_key=True)
+    device_name   = db.Column(db.String(128), nullable=False)
+    resource_name = db.Column(db.String(128), nullable=False)
+    origin        = db.Column(db.BigInteger, nullable=False)  # Epoch nano giây (giống EdgeX)
+    value         = db.Column(db.Float, nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_readings_device_resource_origin', 'device_name', 'resource_name', 'origin', unique=True),
+    )
+
+    def __repr__(self):
+        return f"<Reading {self.device_name}/{self.resource_name} @{self.origin} = {self.value}>"
+
+
+class ReadingRollups(db.Model):
+    """
+    Tổng hợp sẵn theo giờ / ngày của bảng readings, cập nhật tăng dần mỗi lần sync.
+    bucket là mốc bắt đầu (ns): đầu giờ cho period 'hour', nửa đêm giờ địa phương cho 'day'.
+    """
+
+    __tablename__ = 'reading_rollups'
+
+    id            = db.Column(db.Integer, primary_key=True)
+    device_name   = db.Column(db.String(128), nullable=False)
+    resource_name = db.Column(db.String(128), nullable=False)
+    period        = db.Column(db.String(8), nullable=False)  # 'hour' | 'day'
+    bucket        = db.Column(db.BigInteger, nullable=False)
+    min           = db.Column(db.Float, nullable=False)
+    max           = db.Column(db.Float, nullable=False)
+    sum           = db.Column(db.Float, nullable=False)
+    count         = db.Column(db.Integer, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_rollups_device_resource_period_bucket', 'device_name', 'resource_name', 'period', 'bucket', unique=True),
+    )
+
+    def __repr__(self):
+        return f"<Rollup {self.device_name}/{self.resource_name} {self.period}@{self.bucket} n={self.count}>"
+
+
+class Devices(db.Model):
+    """
+    Bản sao cục bộ danh sách device của core-metadata (làm mới tăng dần theo 'modified').
+    Farm được ánh xạ tới device qua tên (Farms.name == Devices.name).
+    """
+
+    __tablename__ = 'devices'
+
+    id             = db.Column(db.Integer, primary_key=True)
+    name           = db.Column(db.String(128), nullable=False, unique=True, index=True)
+    profile_name   = db.Column(db.String(128), nullable=True, index=True)
+    service_name   = db.Column(db.String(128), nullable=True, index=True)
+    admin_state    = db.Column(db.String(16), nullable=True)
+    operating_state = db.Column(db.String(16), nullable=True)
+    labels         = db.Column(db.Text(), nullable=True)             # JSON list, dùng để hiển thị
+    protocols_hash = db.Column(db.String(40), nullable=True)         # sha1 của protocols (kể cả rules)
+    modified       = db.Column(db.BigInteger, nullable=False, default=0)  # 'modified' của EdgeX (ms)
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "profileName": self.profile_name,
+            "serviceName": self.service_name,
+            "adminState": self.admin_state,
+            "operatingState": self.operating_state,
+            "labels": json.loads(self.labels or "[]"),
+            "protocolsHash": self.protocols_hash,
+            "modified": self.modified
+        }
+
+    def __repr__(self):
+        return f"<Device {self.name} ({self.profile_name})>"
+
+
+class DeviceLabels(db.Model):
+    """Index nhãn -> device cho bảng devices (một dòng cho mỗi cặp device, nhãn)."""
+
+    __tablename__ = 'device_labels'
+
+    id          = db.Column(db.Integer, primary_key=True)
+    device_name = db.Column(db.String(128), nullable=False)
+    label       = db.Column(db.String(128), nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_device_labels_label_device', 'label', 'device_name', unique=True),
+    )
+
+    def __repr__(self):
+        return f"<DeviceLabel {self.label} -> {self.device_name}>"
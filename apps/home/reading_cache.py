@@ -0,0 +1,219 @@
+# -*- encoding: utf-8 -*-
+"""
+Cache reading mới nhất theo (device, resource).
+
+- TTL ngắn: nhiều tab dashboard cùng mở một farm chỉ gây ra một lần gọi core-data mỗi TTL.
+- Single-flight: các request đồng thời cùng key chờ chung một lần fetch thay vì mỗi request tự gọi.
+- Lỗi không được cache: loader raise, hoặc bỏ resource khỏi kết quả, thì request sau fetch lại
+  ngay thay vì thấy "không có dữ liệu" tới hết TTL.
+- Backend mặc định là bộ nhớ trong process; nếu cấu hình READING_CACHE_REDIS_URL thì dùng Redis
+  để các gunicorn worker chia sẻ cache.
+"""
+
+import json
+import logging
+import threading
+import time
+
+
+class _LocalBackend:
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def delete_prefix(self, prefix):
+        with self._lock:
+            for key in [k for k in self._data if k.startswith(prefix)]:
+                del self._data[key]
+
+
+class _RedisBackend:
+    def __init__(self, url):
+        import redis
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        raw = self._client.get(key)
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key, value, ttl):
+        self._client.set(key, json.dumps(value), px=int(ttl * 1000))
+
+    def delete(self, key):
+        self._client.delete(key)
+
+    def delete_prefix(self, prefix):
+        for key in self._client.scan_iter(match=prefix + "*"):
+            self._client.delete(key)
+
+
+class _Flight:
+    """Một lần fetch đang chạy; các request khác cùng key chờ trên event."""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+
+
+class ReadingCache:
+    DEFAULT_TTL = 3.0  # Giây
+
+    def __init__(self, ttl=DEFAULT_TTL):
+        self.ttl = ttl
+        self._backend = _LocalBackend()
+        self._flights = {}
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "coalesced": 0, "backend_errors": 0}
+
+    def init_app(self, app):
+        self.ttl = float(app.config.get("READING_CACHE_TTL", self.ttl))
+        redis_url = app.config.get("READING_CACHE_REDIS_URL")
+        if redis_url:
+            try:
+                self._backend = _RedisBackend(redis_url)
+            except Exception as e:
+                logging.error(f"Reading cache: cannot use Redis ({e}), fallback to in-process cache")
+
+    @staticmethod
+    def _key(device_name, resource_name):
+        return f"reading:{device_name}:{resource_name}"
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self._stats[name] += n
+
+    def _backend_get(self, key):
+        try:
+            return self._backend.get(key)
+        except Exception as e:
+            self._count("backend_errors")
+            logging.error(f"Reading cache get error: {e}")
+            return None
+
+    def _backend_set(self, key, value):
+        try:
+            self._backend.set(key, value, self.ttl)
+        except Exception as e:
+            self._count("backend_errors")
+            logging.error(f"Reading cache set error: {e}")
+
+    def get(self, device_name, resource_name, loader):
+        """
+        Trả về reading mới nhất của (device, resource).
+
+        Args:
+            loader: hàm không tham số, trả về reading (dict) hoặc None (không có reading) khi
+                    cache miss; raise khi lỗi (kết quả không được cache).
+        """
+        return self.get_many(
+            device_name, [resource_name],
+            lambda device, resources: {resources[0]: loader()}
+        )[resource_name]
+
+    def get_many(self, device_name, resource_names, loader):
+        """
+        Trả về {resource: reading} cho nhiều resource của một device.
+
+        Args:
+            loader: hàm (device_name, [resource]) -> {resource: reading}, chỉ được gọi
+                    với các resource bị miss mà chưa có request nào khác đang fetch. Resource
+                    vắng trong kết quả (hoặc loader raise) được coi là lỗi: trả về None, không cache.
+        """
+        result = {}
+        owned, waiting = [], []
+
+        for resource in resource_names:
+            key = self._key(device_name, resource)
+            cached = self._backend_get(key)
+            if cached is not None:
+                self._count("hits")
+                result[resource] = cached["reading"]
+                continue
+
+            with self._lock:
+                flight = self._flights.get(key)
+                if flight is None:
+                    flight = self._flights[key] = _Flight()
+                    owned.append((resource, key, flight))
+                    self._stats["misses"] += 1
+                else:
+                    waiting.append((resource, flight))
+                    self._stats["coalesced"] += 1
+
+        if owned:
+            try:
+                loaded = loader(device_name, [resource for resource, _, _ in owned]) or {}
+            except Exception as e:
+                logging.error(f"Reading cache loader error: {e}")
+                loaded = {}
+            for resource, key, flight in owned:
+                reading = loaded.get(resource)
+                if resource in loaded:
+                    self._backend_set(key, {"reading": reading})
+                flight.value = reading
+                with self._lock:
+                    self._flights.pop(key, None)
+                flight.event.set()
+                result[resource] = reading
+
+        for resource, flight in waiting:
+            flight.event.wait()
+            result[resource] = flight.value
+
+        return result
+
+    def peek_many(self, device_name, resource_names):
+        """Chỉ đọc cache, không fetch: {resource: reading} cho các resource đang có trong cache."""
+        result = {}
+        for resource in resource_names:
+            cached = self._backend_get(self._key(device_name, resource))
+            if cached is not None:
+                self._count("hits")
+                result[resource] = cached["reading"]
+        return result
+
+    def put(self, device_name, resource_name, reading):
+        """Ghi trực tiếp reading mới (ví dụ từ poller của stream) vào cache."""
+        self._backend_set(self._key(device_name, resource_name), {"reading": reading})
+
+    def invalidate(self, device_name, resource_name=None):
+        """Xóa cache của một resource, hoặc của cả device nếu không truyền resource_name."""
+        try:
+            if resource_name is None:
+                self._backend.delete_prefix(f"reading:{device_name}:")
+            else:
+                self._backend.delete(self._key(device_name, resource_name))
+        except Exception as e:
+            self._count("backend_errors")
+            logging.error(f"Reading cache invalidate error: {e}")
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"] + stats["coalesced"]
+        stats["hit_ratio"] = round((stats["hits"] + stats["coalesced"]) / lookups, 3) if lookups else None
+        stats["ttl"] = self.ttl
+        stats["backend"] = "redis" if isinstance(self._backend, _RedisBackend) else "local"
+        return stats
+
+
+reading_cache = ReadingCache()
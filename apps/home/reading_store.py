@@ -0,0 +1,369 @@
+# -*- encoding: utf-8 -*-
+"""
+Lưu trữ time-series readings cục bộ (bảng 'readings', qua SQLAlchemy `db`).
+
+Đồng bộ tăng dần: với mỗi (device, resource) chỉ kéo các reading mới hơn 'origin' lớn nhất
+đã lưu. Các truy vấn thống kê sau đó là range scan trên index (device, resource, origin)
+thay vì gọi HTTP tới core-data.
+
+Mỗi lô reading mới đồng thời được cộng dồn vào bảng rollup theo giờ / ngày
+(reading_rollups), nên biểu đồ tuần / tháng không phải quét lại reading thô.
+
+Route chỉ đọc bảng local; việc kéo từ core-data nằm ở luồng sync nền (start_background_sync) và
+schedule_sync() (đồng bộ bù chạy nền khi lần sync gần nhất đã cũ, request không chờ).
+"""
+
+import logging
+import os
+import heapq
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from flask import current_app
+from sqlalchemy import func, insert
+from sqlalchemy.exc import SQLAlchemyError
+
+from apps import db
+from . import edgex_interface as edgex
+from . import device_inventory
+from .aggregation import compute_rollups
+from .models import Readings, ReadingRollups
+
+SYNC_RESOURCES     = ["NhietDo", "DoAm", "AnhSang", "Relay1", "Relay2", "Relay3"]
+SYNC_PAGE_SIZE     = int(os.getenv("READING_SYNC_PAGE_SIZE", 1000))
+SYNC_BACKFILL_DAYS = int(os.getenv("READING_SYNC_BACKFILL_DAYS", 31))  # Lần sync đầu chỉ kéo N ngày gần nhất
+SYNC_TOPUP_AGE     = float(os.getenv("READING_SYNC_TOPUP_AGE", 30))  # Giây: request chỉ kích hoạt sync bù khi sync gần nhất cũ hơn
+EXPORT_PAGE_SIZE   = 5000
+
+_sync_locks = {}
+_sync_locks_guard = threading.Lock()
+_last_sync = {}  # (device, resource) -> time.monotonic() của lần sync (hoặc lên lịch sync) gần nhất
+_topup_executor = None
+_topup_pid = None
+
+
+def _sync_lock(device_name, resource_name):
+    with _sync_locks_guard:
+        return _sync_locks.setdefault((device_name, resource_name), threading.Lock())
+
+
+def parse_value(raw):
+    """Chuyển giá trị reading (chuỗi) sang float; relay 'true'/'false' thành 1.0/0.0."""
+    if isinstance(raw, bool):
+        return float(raw)
+    text = str(raw).strip().lower()
+    if text == "true":
+        return 1.0
+    if text == "false":
+        return 0.0
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+def last_origin(device_name, resource_name):
+    """'origin' (ns) mới nhất đã lưu, hoặc None nếu chưa có."""
+    return db.session.query(func.max(Readings.origin)).filter(
+        Readings.device_name == device_name,
+        Readings.resource_name == resource_name
+    ).scalar()
+
+
+def first_origin(device_name, resource_names):
+    """'origin' (ns) cũ nhất đã lưu của các resource, hoặc None nếu chưa có."""
+    return db.session.query(func.min(Readings.origin)).filter(
+        Readings.device_name == device_name,
+        Readings.resource_name.in_(list(resource_names))
+    ).scalar()
+
+
+def backfill_start_ns():
+    """Mốc đầu của khoảng mà lần sync đầu tiên kéo về (SYNC_BACKFILL_DAYS ngày trước)."""
+    return (edgex.now_ms() - SYNC_BACKFILL_DAYS * 24 * 3600 * 1000) * 1_000_000
+
+
+def fetch_new_readings(device_name, resource_name, since_ns=None):
+    """
+    Kéo từ core-data các reading có origin > since_ns (chỉ gọi HTTP, không đụng tới DB).
+
+    Returns:
+        list: các reading (dict của EdgeX), mới nhất trước.
+
+    Raises:
+        requests.RequestException: khi một trang bất kỳ không tải được; không trả về kết quả dở dang.
+    """
+    end_ms = edgex.now_ms()
+    if since_ns:
+        start_ms = since_ns // 1_000_000
+    else:
+        start_ms = end_ms - SYNC_BACKFILL_DAYS * 24 * 3600 * 1000
+
+    return [
+        r for r in edgex.iter_readings(device_name, resource_name, start_ms=start_ms, end_ms=end_ms,
+                                       page_size=SYNC_PAGE_SIZE, prefetch=True)
+        if not since_ns or int(r.get("origin", 0)) > since_ns
+    ]
+
+
+def store_readings(device_name, resource_name, readings):
+    """Ghi các reading vào bảng local. Returns: số dòng đã ghi."""
+    rows, seen = [], set()
+    for r in readings:
+        origin = int(r.get("origin") or 0)
+        value = parse_value(r.get("value"))
+        if origin <= 0 or value is None or origin in seen:
+            continue
+        seen.add(origin)
+        rows.append({"device_name": device_name, "resource_name": resource_name, "origin": origin, "value": value})
+
+    if not rows:
+        return 0
+    try:
+        db.session.execute(insert(Readings), rows)
+        origins = np.array([row["origin"] for row in rows], dtype=np.int64)
+        values = np.array([row["value"] for row in rows], dtype=np.float64)
+        update_rollups(device_name, resource_name, origins, values)
+        db.session.commit()
+        return len(rows)
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        logging.error(f"Error storing readings for {device_name}/{resource_name}: {e}")
+        return 0
+
+
+def update_rollups(device_name, resource_name, origins, values):
+    """Cộng dồn một lô reading mới vào rollup giờ / ngày (chưa commit)."""
+    for period, (bucket_starts, buckets) in compute_rollups(origins, values).items():
+        starts = [int(b) for b in bucket_starts]
+        existing = {
+            rollup.bucket: rollup
+            for rollup in ReadingRollups.query.filter(
+                ReadingRollups.device_name == device_name,
+                ReadingRollups.resource_name == resource_name,
+                ReadingRollups.period == period,
+                ReadingRollups.bucket.in_(starts)
+            )
+        }
+        for i, bucket in enumerate(starts):
+            rollup = existing.get(bucket)
+            if rollup is None:
+                db.session.add(ReadingRollups(
+                    device_name=device_name, resource_name=resource_name, period=period, bucket=bucket,
+                    min=float(buckets["min"][i]), max=float(buckets["max"][i]),
+                    sum=float(buckets["sum"][i]), count=int(buckets["count"][i])
+                ))
+            else:
+                rollup.min = min(rollup.min, float(buckets["min"][i]))
+                rollup.max = max(rollup.max, float(buckets["max"][i]))
+                rollup.sum += float(buckets["sum"][i])
+                rollup.count += int(buckets["count"][i])
+
+
+def rebuild_rollups(device_name, resource_name):
+    """Tính lại toàn bộ rollup từ reading thô (ví dụ dữ liệu có trước khi có bảng rollup)."""
+    ReadingRollups.query.filter_by(device_name=device_name, resource_name=resource_name).delete()
+    origins, values = query_series(device_name, resource_name, 0, np.iinfo(np.int64).max)
+    if len(origins):
+        update_rollups(device_name, resource_name, origins, values)
+    db.session.commit()
+
+
+def _has_rollups(device_name, resource_name):
+    return db.session.query(ReadingRollups.id).filter_by(device_name=device_name, resource_name=resource_name).first() is not None
+
+
+def sync_resource(device_name, resource_name):
+    """Đồng bộ tăng dần một (device, resource). Returns: số reading mới."""
+    return sync_resources(device_name, [resource_name])[resource_name]
+
+
+def sync_resources(device_name, resource_names):
+    """
+    Đồng bộ nhiều resource của một device: các lần kéo HTTP chạy song song,
+    phần ghi DB chạy tuần tự trên luồng hiện tại.
+
+    Resource nào kéo lỗi (dù chỉ một trang) thì không ghi gì cho resource đó, 'origin' lớn nhất
+    đã lưu giữ nguyên và lần sync sau kéo lại cả khoảng; các resource khác vẫn được ghi.
+
+    Returns:
+        dict: {resource: số reading mới, hoặc None nếu kéo lỗi}
+    """
+    resource_names = sorted(set(resource_names))
+    locks = [_sync_lock(device_name, r) for r in resource_names]
+    for lock in locks:
+        lock.acquire()
+    try:
+        since = {}
+        for resource in resource_names:
+            since[resource] = last_origin(device_name, resource)
+            if since[resource] is not None and not _has_rollups(device_name, resource):
+                rebuild_rollups(device_name, resource)
+
+        with ThreadPoolExecutor(max_workers=max(len(resource_names), 1)) as executor:
+            futures = {r: executor.submit(fetch_new_readings, device_name, r, since[r]) for r in resource_names}
+
+        result = {}
+        for resource, future in futures.items():
+            try:
+                readings = future.result()
+            except Exception as e:
+                logging.error(f"Error fetching readings for {device_name}/{resource}: {e}")
+                result[resource] = None
+                continue
+            result[resource] = store_readings(device_name, resource, readings)
+            with _sync_locks_guard:
+                _last_sync[(device_name, resource)] = time.monotonic()
+        return result
+    finally:
+        for lock in locks:
+            lock.release()
+
+
+def sync_device(device_name, resource_names=SYNC_RESOURCES):
+    return sync_resources(device_name, resource_names)
+
+
+def _get_topup_executor():
+    global _topup_executor, _topup_pid
+    pid = os.getpid()
+    if _topup_executor is None or _topup_pid != pid:
+        _topup_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="reading-topup")
+        _topup_pid = pid
+    return _topup_executor
+
+
+def schedule_sync(device_name, resource_names, max_age=SYNC_TOPUP_AGE):
+    """
+    Đồng bộ bù không chặn cho route: các resource chưa được sync trong max_age giây được
+    sync ở luồng nền (mỗi resource tối đa một lần mỗi max_age giây); request không chờ kết quả.
+
+    Returns:
+        list: các resource đã được lên lịch sync
+    """
+    now = time.monotonic()
+    with _sync_locks_guard:
+        stale = [r for r in dict.fromkeys(resource_names)
+                 if (device_name, r) not in _last_sync or now - _last_sync[(device_name, r)] >= max_age]
+        for resource in stale:
+            _last_sync[(device_name, resource)] = now
+    if not stale:
+        return []
+
+    app = current_app._get_current_object()
+
+    def run():
+        with app.app_context():
+            try:
+                sync_resources(device_name, stale)
+            except Exception as e:
+                logging.error(f"Reading top-up sync error ({device_name}): {e}")
+            finally:
+                db.session.remove()
+
+    _get_topup_executor().submit(run)
+    return stale
+
+
+def query_series(device_name, resource_name, start_ns, end_ns):
+    """
+    Range scan trên index (device, resource, origin), origin trong [start_ns, end_ns).
+
+    Returns:
+        tuple: (np.ndarray origin int64 tăng dần, np.ndarray value float64)
+    """
+    rows = db.session.query(Readings.origin, Readings.value).filter(
+        Readings.device_name == device_name,
+        Readings.resource_name == resource_name,
+        Readings.origin >= start_ns,
+        Readings.origin < end_ns
+    ).order_by(Readings.origin.asc()).all()
+    origins = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+    values = np.fromiter((r[1] for r in rows), dtype=np.float64, count=len(rows))
+    return origins, values
+
+
+def query_rollups(device_name, resource_name, period, start_ns, end_ns):
+    """
+    Đọc rollup của một period với bucket trong [start_ns, end_ns).
+
+    Returns:
+        tuple: các mảng (bucket, min, max, sum, count), bucket tăng dần
+    """
+    return query_rollups_many(device_name, [resource_name], period, start_ns, end_ns)[resource_name]
+
+
+def query_rollups_many(device_name, resource_names, period, start_ns, end_ns):
+    """Như query_rollups nhưng cho nhiều resource trong một truy vấn. Returns: {resource: tuple mảng}."""
+    rows = db.session.query(
+        ReadingRollups.resource_name, ReadingRollups.bucket, ReadingRollups.min,
+        ReadingRollups.max, ReadingRollups.sum, ReadingRollups.count
+    ).filter(
+        ReadingRollups.device_name == device_name,
+        ReadingRollups.resource_name.in_(resource_names),
+        ReadingRollups.period == period,
+        ReadingRollups.bucket >= start_ns,
+        ReadingRollups.bucket < end_ns
+    ).order_by(ReadingRollups.resource_name, ReadingRollups.bucket.asc()).all()
+
+    result = {}
+    for resource in resource_names:
+        columns = list(zip(*(row[1:] for row in rows if row[0] == resource))) or [(), (), (), (), ()]
+        result[resource] = (
+            np.array(columns[0], dtype=np.int64),
+            np.array(columns[1], dtype=np.float64),
+            np.array(columns[2], dtype=np.float64),
+            np.array(columns[3], dtype=np.float64),
+            np.array(columns[4], dtype=np.int64),
+        )
+    return result
+
+
+def iter_resource(device_name, resource_name, start_ns, end_ns, page_size=EXPORT_PAGE_SIZE):
+    """
+    Duyệt lười các reading (origin, value) trong [start_ns, end_ns) theo từng trang,
+    phân trang bằng keyset trên origin nên mỗi trang là một range scan trên index.
+    """
+    cursor = start_ns - 1
+    while True:
+        page = db.session.query(Readings.origin, Readings.value).filter(
+            Readings.device_name == device_name,
+            Readings.resource_name == resource_name,
+            Readings.origin > cursor,
+            Readings.origin < end_ns
+        ).order_by(Readings.origin.asc()).limit(page_size).all()
+        for origin, value in page:
+            yield origin, resource_name, value
+        if len(page) < page_size:
+            return
+        cursor = page[-1][0]
+
+
+def iter_readings(device_name, resource_names, start_ns, end_ns, page_size=EXPORT_PAGE_SIZE):
+    """Gộp lười nhiều resource theo thứ tự thời gian. Yields: (origin, resource_name, value)."""
+    return heapq.merge(*(iter_resource(device_name, r, start_ns, end_ns, page_size) for r in resource_names))
+
+
+def start_background_sync(app, interval):
+    """Luồng nền đồng bộ định kỳ tất cả farm (tên farm = tên device EdgeX)."""
+    from apps.authentication.models import Farms
+
+    def run():
+        while True:
+            time.sleep(interval)
+            with app.app_context():
+                try:
+                    device_inventory.ensure_fresh()
+                    device_names = [name for (name,) in db.session.query(Farms.name).distinct()]
+                    for device_name in device_names:
+                        sync_device(device_name)
+                except Exception as e:
+                    logging.error(f"Reading sync error: {e}")
+                finally:
+                    db.session.remove()
+
+    thread = threading.Thread(target=run, name="reading-sync", daemon=True)
+    thread.start()
+    return thread
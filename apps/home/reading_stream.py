@@ -0,0 +1,121 @@
+# -*- encoding: utf-8 -*-
+"""
+Đẩy giá trị cảm biến / relay tới dashboard qua Server-Sent Events.
+
+Mỗi device có đúng một luồng poller nền gọi core-data và ghi kết quả vào reading_cache
+(các request polling cũ đọc lại từ cache). Khi có giá trị mới, poller phát snapshot tới
+hàng đợi của mọi client đang kết nối. Poller tự dừng khi không còn client nào.
+
+Mỗi kết nối SSE giữ một luồng của gunicorn (gthread) suốt thời gian mở, nên số client SSE
+bị giới hạn ở STREAM_MAX_CLIENTS (thấp hơn GUNICORN_THREADS) để luôn còn luồng cho request
+thường; client bị từ chối nhận 503 và chuyển sang polling snapshot.
+"""
+
+import logging
+import os
+import queue
+import threading
+
+from .edgex_async import edgex_sync
+from .reading_cache import reading_cache
+
+STREAM_POLL_INTERVAL = float(os.getenv("STREAM_POLL_INTERVAL", 1))  # Giây
+STREAM_KEEPALIVE     = float(os.getenv("STREAM_KEEPALIVE", 15))     # Giây
+STREAM_MAX_CLIENTS   = int(os.getenv("STREAM_MAX_CLIENTS", 8))
+STREAM_RETRY_AFTER   = 30  # Giây, header Retry-After khi đã đủ client
+SUBSCRIBER_QUEUE_SIZE = 10
+
+
+class DevicePoller(threading.Thread):
+    def __init__(self, hub, device_name, resource_names, interval):
+        super().__init__(name=f"stream-poller-{device_name}", daemon=True)
+        self.hub = hub
+        self.device_name = device_name
+        self.resource_names = list(resource_names)
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.last_snapshot = None
+
+    def poll_once(self):
+        # strict: resource đọc lỗi không có trong kết quả nên không được ghi vào cache
+        readings = edgex_sync.get_latest_readings(self.device_name, self.resource_names, strict=True)
+        for resource, reading in readings.items():
+            reading_cache.put(self.device_name, resource, reading)
+        readings = {r: readings.get(r) for r in self.resource_names}
+        snapshot = {
+            "device": self.device_name,
+            "values": {r: (reading.get("value") if reading else None) for r, reading in readings.items()},
+            "origins": {r: (reading.get("origin") if reading else None) for r, reading in readings.items()}
+        }
+        if snapshot != self.last_snapshot:
+            self.last_snapshot = snapshot
+            self.hub.publish(self.device_name, snapshot)
+
+    def run(self):
+        while not self.stop_event.is_set():
+            try:
+                self.poll_once()
+            except Exception as e:
+                logging.error(f"Stream poller error ({self.device_name}): {e}")
+            self.stop_event.wait(self.interval)
+
+
+class StreamHub:
+    def __init__(self, resource_names, interval=STREAM_POLL_INTERVAL, max_clients=STREAM_MAX_CLIENTS):
+        self.resource_names = resource_names
+        self.interval = interval
+        self.max_clients = max_clients
+        self._subscribers = {}  # device_name -> set(queue.Queue)
+        self._clients = set()   # Hàng đợi của các kết nối SSE (tính vào max_clients)
+        self._pollers = {}      # device_name -> DevicePoller
+        self._lock = threading.Lock()
+
+    def subscribe(self, device_name, client=False):
+        """
+        Đăng ký một client; trả về hàng đợi nhận các snapshot mới của device.
+        client=True cho kết nối SSE: trả về None nếu đã đủ max_clients kết nối.
+        """
+        q = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            if client:
+                if len(self._clients) >= self.max_clients:
+                    return None
+                self._clients.add(q)
+            self._subscribers.setdefault(device_name, set()).add(q)
+            poller = self._pollers.get(device_name)
+            if poller is None or not poller.is_alive():
+                poller = self._pollers[device_name] = DevicePoller(self, device_name, self.resource_names, self.interval)
+                poller.start()
+            elif poller.last_snapshot is not None:
+                # Client mới nhận ngay giá trị gần nhất, không phải chờ lần thay đổi tiếp theo
+                q.put_nowait(poller.last_snapshot)
+        return q
+
+    def unsubscribe(self, device_name, q):
+        with self._lock:
+            self._clients.discard(q)
+            subscribers = self._subscribers.get(device_name, set())
+            subscribers.discard(q)
+            if not subscribers:
+                self._subscribers.pop(device_name, None)
+                poller = self._pollers.pop(device_name, None)
+                if poller:
+                    poller.stop_event.set()
+
+    def publish(self, device_name, snapshot):
+        with self._lock:
+            subscribers = list(self._subscribers.get(device_name, ()))
+        for q in subscribers:
+            try:
+                q.put_nowait(snapshot)
+            except queue.Full:
+                # Client chậm: bỏ snapshot cũ nhất, chỉ cần giữ giá trị mới nhất
+                try:
+                    q.get_nowait()
+                    q.put_nowait(snapshot)
+                except (queue.Empty, queue.Full):
+                    pass
+
+    def stats(self):
+        with self._lock:
+            return {device: len(subs) for device, subs in self._subscribers.items()}
@@ -5,14 +5,27 @@ Copyright (c) 2019 - present AppSeed.us
 
 from apps.home import blueprint
 from flask import render_template, request
-from flask_login import login_required
+from flask_login import login_required, current_user
 from jinja2 import TemplateNotFound
+from werkzeug.utils import secure_filename
 from . import edgex_interface as edgex
-from flask import jsonify, request
+from flask import jsonify, request, Response, stream_with_context, g
+import asyncio
+import csv
 import datetime
+import io
+import json
 import logging
+import queue
 
-from .edgex_interface import Rule
+from .edgex_interface import Rule, RuleRepository
+from .rule_table import RuleTable
+from . import rule_simulator, device_inventory
+from .edgex_async import edgex_sync
+from .reading_cache import reading_cache
+from . import reading_store, aggregation
+from .reading_stream import StreamHub, STREAM_KEEPALIVE, STREAM_RETRY_AFTER
+from .command_queue import command_queue
 
 
 
@@ -31,50 +44,214 @@ def get_reading(farm_name):
         return jsonify({"error": "Missing farm_name or resource"}), 400
 
     try:
-        readings = edgex.get_readings(farm_name, resource, limit=1)
-        if readings and len(readings) > 0:
-            return jsonify({"value": readings[0].get("value")})
+        reading = reading_cache.get(farm_name, resource, lambda: next(iter(edgex.fetch_readings(farm_name, resource, limit=1)), None))
+        if reading:
+            return jsonify({"value": reading.get("value")})
         return jsonify({"value": None})
     except Exception as e:
         logging.error(f"Error in get_reading: {e}")
         return jsonify({"error": str(e)}), 500
 
+# Các resource hiển thị trên dashboard (cảm biến + relay)
+DASHBOARD_RESOURCES = ["NhietDo", "DoAm", "AnhSang", "Relay1", "Relay2", "Relay3"]
+
+# API endpoint lấy toàn bộ giá trị mới nhất của dashboard trong một request
+@blueprint.route('/api/<farm_name>/snapshot')
+def get_snapshot(farm_name):
+    resources = request.args.get('resources')
+    resources = [r for r in resources.split(',') if r] if resources else DASHBOARD_RESOURCES
+
+    try:
+        # strict: resource đọc lỗi không có trong kết quả nên không bị cache thành "không có dữ liệu"
+        readings = reading_cache.get_many(farm_name, resources,
+                                          lambda device, names: edgex_sync.get_latest_readings(device, names, strict=True))
+        return jsonify({
+            "device": farm_name,
+            "values": {r: (reading.get("value") if reading else None) for r, reading in readings.items()},
+            "origins": {r: (reading.get("origin") if reading else None) for r, reading in readings.items()}
+        })
+    except Exception as e:
+        logging.error(f"Error in get_snapshot: {e}")
+        return jsonify({"error": str(e)}), 500
+
+stream_hub = StreamHub(DASHBOARD_RESOURCES)
+command_queue.attach_stream(stream_hub)
+
+OVERVIEW_FARM_TIMEOUT = 3.0  # Giây cho mỗi farm
+OVERVIEW_TIMEOUT      = 8.0  # Giây cho cả trang
+OVERVIEW_CONCURRENCY  = 8    # Số farm gọi core-data cùng lúc
+
+# Trạng thái mới nhất của tất cả farm của người dùng; farm chậm / lỗi không chặn các farm khác
+@blueprint.route('/api/farms/overview')
+@login_required
+def get_farms_overview():
+    farms = list(current_user.farms)
+    names = sorted({farm.name for farm in farms})
+
+    readings = {name: reading_cache.peek_many(name, DASHBOARD_RESOURCES) for name in names}
+    missing = [name for name in names if len(readings[name]) < len(DASHBOARD_RESOURCES)]
+
+    try:
+        fetched = edgex_sync.get_latest_readings_many(
+            missing, DASHBOARD_RESOURCES, timeout=OVERVIEW_FARM_TIMEOUT,
+            concurrency=OVERVIEW_CONCURRENCY, total_timeout=OVERVIEW_TIMEOUT
+        )
+    except Exception as e:
+        logging.error(f"Error in get_farms_overview: {e}")
+        fetched = {name: e for name in missing}
+
+    status = {name: "ok" for name in names}
+    for name, result in fetched.items():
+        if isinstance(result, dict):
+            for resource, reading in result.items():
+                reading_cache.put(name, resource, reading)
+            readings[name] = result
+        else:
+            status[name] = "timeout" if isinstance(result, (TimeoutError, asyncio.TimeoutError)) else "error"
+
+    overview = []
+    for farm in farms:
+        farm_readings = readings.get(farm.name, {})
+        overview.append({
+            "id": farm.id,
+            "name": farm.name,
+            "description": farm.description,
+            "status": status[farm.name],
+            "values": {r: (farm_readings[r].get("value") if farm_readings.get(r) else None) for r in DASHBOARD_RESOURCES},
+            "origins": {r: (farm_readings[r].get("origin") if farm_readings.get(r) else None) for r in DASHBOARD_RESOURCES}
+        })
+    return jsonify({
+        "farms": overview,
+        "partial": any(s != "ok" for s in status.values())
+    })
+
+# Server-Sent Events: đẩy snapshot mới mỗi khi cảm biến / relay thay đổi
+# Đã đủ STREAM_MAX_CLIENTS kết nối -> 503, client chuyển sang polling /api/<farm>/snapshot
+@blueprint.route('/api/<farm_name>/stream')
+def stream_readings(farm_name):
+    q = stream_hub.subscribe(farm_name, client=True)
+    if q is None:
+        return jsonify({"error": "Too many stream clients"}), 503, {"Retry-After": str(STREAM_RETRY_AFTER)}
+
+    def generate():
+        while True:
+            try:
+                snapshot = q.get(timeout=STREAM_KEEPALIVE)
+            except queue.Empty:
+                yield ": keep-alive\n\n"
+                continue
+            yield f"data: {json.dumps(snapshot)}\n\n"
+
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+    # Gọi cả khi generator chưa từng chạy (client ngắt trước byte đầu tiên)
+    response.call_on_close(lambda: stream_hub.unsubscribe(farm_name, q))
+    return response
+
+# Thống kê hit/miss của cache reading
+@blueprint.route('/api/cache/stats')
+def get_cache_stats():
+    stats = reading_cache.stats()
+    stats["stream_subscribers"] = stream_hub.stats()
+    stats["device_cache"] = edgex.device_cache_stats()
+    stats["command_queue"] = command_queue.stats()
+    return jsonify(stats)
+
+CONTROL_WAIT = 2.0  # Giây chờ lệnh hoàn tất trước khi trả về trạng thái "pending"
+
 # API endpoint để điều khiển thiết bị
+# Lệnh đi qua hàng đợi (gửi + xác nhận trong luồng nền); request chỉ chờ tối đa CONTROL_WAIT giây
 @blueprint.route('/api/device/<device>/control/<command>', methods=['POST'])
 def control_device(device, command):
     try:
         state = request.json.get('state')
         if state not in ['true', 'false']:
             return jsonify({"error": "Invalid state value"}), 400
-            
-        # Gửi lệnh điều khiển
-        result = edgex.send_command(
-            device_name=device,
-            command_name=command,
-            method="PUT",
-            body={command: state}
-        )
 
-        # Đọc lại trạng thái sau khi điều khiển để xác nhận
-        verify = edgex.send_command(
-            device_name=device,
-            command_name=command,
-            method="GET"
-        )
-        
-        # Kiểm tra xem trạng thái đã được cập nhật chưa
-        actual_state = str(verify.get(command, "false")).lower()
-        success = actual_state == state
-        
+        queued = command_queue.submit(device, command, state)
+        queued.done.wait(CONTROL_WAIT)
+        if not queued.done.is_set():
+            return jsonify({
+                "success": False,
+                "pending": True,
+                "id": queued.id,
+                "status": queued.status
+            }), 202
+
         return jsonify({
-            "success": success,
-            "state": actual_state,
-            "result": result
+            "success": queued.acknowledged,
+            "state": queued.actual_state,
+            "id": queued.id,
+            "status": queued.status,
+            "error": queued.error
         })
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
 
+# Xếp lệnh điều khiển vào hàng đợi của device, trả về id ngay (202); kết quả hỏi lại qua /api/commands/<id>
+@blueprint.route('/api/device/<device>/commands/<command>', methods=['POST'])
+def enqueue_device_command(device, command):
+    state = str((request.get_json(silent=True) or {}).get('state', '')).lower()
+    if state not in ['true', 'false']:
+        return jsonify({"error": "Invalid state value"}), 400
+
+    queued = command_queue.submit(device, command, state)
+    response = jsonify(queued.to_dict())
+    response.status_code = 202
+    response.headers["Location"] = f"/api/commands/{queued.id}"
+    return response
+
+
+MAX_GROUP_COMMANDS = 32
+
+def _group_items(data, device=None):
+    """[(device, command, state)] từ body {"commands": [{"device"?, "command", "state"}]}; lỗi -> ValueError."""
+    commands = data.get("commands") if isinstance(data, dict) else data
+    if not isinstance(commands, list) or not commands:
+        raise ValueError("Missing command list")
+    if len(commands) > MAX_GROUP_COMMANDS:
+        raise ValueError(f"Too many commands (max {MAX_GROUP_COMMANDS})")
+
+    items = []
+    for item in commands:
+        if not isinstance(item, dict):
+            raise ValueError("Invalid command entry")
+        state = str(item.get("state", "")).lower()
+        target = device or item.get("device")
+        if not target or not item.get("command") or state not in ["true", "false"]:
+            raise ValueError(f"Invalid command entry: {item}")
+        items.append((target, item["command"], state))
+    return items
+
+
+# Lệnh nhóm: nhiều relay (một hoặc nhiều device) xếp vào hàng đợi của từng device, trả về các id ngay (202);
+# kết quả từng lệnh hỏi lại qua /api/commands/<id>
+@blueprint.route('/api/device/<device>/commands', methods=['POST'])
+@blueprint.route('/api/commands/group', methods=['POST'])
+def group_command(device=None):
+    try:
+        items = _group_items(request.get_json(silent=True), device)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    commands = command_queue.submit_group(items)
+    response = jsonify({"commands": [command.to_dict() for command in commands]})
+    response.status_code = 202
+    return response
+
+
+# Trạng thái / xác nhận của một lệnh đã xếp hàng
+@blueprint.route('/api/commands/<command_id>')
+def get_command_status(command_id):
+    command = command_queue.get(command_id)
+    if command is None:
+        return jsonify({"error": "Command not found"}), 404
+    return jsonify(command.to_dict())
+
+
 @blueprint.route('/automation')
 @login_required
 def automation():
@@ -131,78 +308,225 @@ def get_segment(request):
 # API Endpoints for EdgeX interactions - Real data
 
 
+MAX_CHART_POINTS = 5000
+
+SENSOR_MAP = {
+    "humidity": "DoAm",
+    "temperature": "NhietDo",
+    "light": "AnhSang"
+}
+
 @blueprint.route("/api/<farm_name>/statistics/<sensor_type>")
 def get_sensor_data(farm_name, sensor_type):
     time_range = request.args.get("timeRange", "day")
     selected_date = request.args.get("date", datetime.date.today().isoformat())
 
-    sensor_map = {
-        "humidity": "DoAm",
-        "temperature": "NhietDo",
-        "light": "AnhSang"
-    }
-    resource = sensor_map.get(sensor_type, "NhietDo")
-
-    dt = datetime.datetime.fromisoformat(selected_date)
-    if time_range == "day":
-        start = dt.replace(hour=0, minute=0, second=0, microsecond=0)
-        end = dt.replace(hour=23, minute=59, second=59, microsecond=999999)
-        limit = 24
-    elif time_range == "week":
-        start = dt - datetime.timedelta(days=dt.weekday())
-        end = start + datetime.timedelta(days=6)
-        limit = 7
-    elif time_range == "month":
-        start = dt.replace(day=1)
-        next_month = (start + datetime.timedelta(days=32)).replace(day=1)
-        end = next_month - datetime.timedelta(seconds=1)
-        limit = 30
-    else:
-        start = dt
-        end = dt
-        limit = 24
-
-    start_ms = int(start.timestamp() * 1000)
-    end_ms = int(end.timestamp() * 1000)
-
-    readings = edgex.get_readings(device_name=farm_name, resource_name=resource, start_ms=start_ms, end_ms=end_ms, limit=limit)
-    logging.info(f"Statistics readings for {resource}: {readings}")
-
-    data = []
-    for r in readings:
-        ts = r.get("origin") or r.get("created")
-        try:
-            dt = datetime.datetime.fromtimestamp(int(ts/1_000_000_000))
-            if time_range == "day":
-                label = dt.strftime("%H:%M")
-            else:
-                label = dt.strftime("%d/%m")
-        except:
-            label = "unknown"
-        data.append({
-            "time": label,
-            "value": float(r.get("value", 0))
-        })
-
-    data = data[::-1]
-    return jsonify(data)
+    resource = SENSOR_MAP.get(sensor_type, "NhietDo")
+    # format: json (mặc định, list dict), columnar (các mảng song song) hoặc binary (float64 ms + float32 value)
+    fmt = request.args.get("format", "json")
+
+    # Bucket cố định: 24 giờ (day), 7 ngày (week) hoặc số ngày trong tháng (month)
+    edges, label_format = aggregation.bucket_edges(time_range, selected_date)
+    edges_ns = aggregation.to_ns(edges)
+
+    # Chỉ đọc bảng local (sync bù chạy nền nếu dữ liệu đã cũ), gom nhóm từ rollup thô nhất đủ dùng
+    # (giờ cho day, ngày cho week/month)
+    reading_store.schedule_sync(farm_name, [resource])
+
+    # points=N: trả về chuỗi độ phân giải cao đã downsample (lttb hoặc minmax) thay vì bucket cố định
+    points = request.args.get("points", type=int)
+    if "points" in request.args and (points is None or points < 3):
+        return jsonify({"error": "points must be an integer >= 3"}), 400
+    if points:
+        points = min(points, MAX_CHART_POINTS)
+        origins, values = reading_store.query_series(farm_name, resource, int(edges_ns[0]), int(edges_ns[-1]))
+        if request.args.get("mode", "lttb") == "minmax":
+            keep = aggregation.minmax_downsample(values, points)
+        else:
+            keep = aggregation.lttb(origins, values, points)
+        origins, values = origins[keep], values[keep]
+
+        if fmt == "columnar":
+            return jsonify(aggregation.to_columns(origins // 1_000_000, values))
+        if fmt == "binary":
+            return Response(aggregation.pack_binary(origins // 1_000_000, values), mimetype="application/octet-stream")
+        label_format = "%H:%M" if time_range == "day" else "%d/%m %H:%M"
+        return jsonify(aggregation.to_point_series(origins, values, label_format))
+
+    period = aggregation.rollup_period(time_range)
+    rollups = reading_store.query_rollups(farm_name, resource, period, int(edges_ns[0]), int(edges_ns[-1]))
+    buckets = aggregation.aggregate_rollups(*rollups, edges_ns)
+
+    if fmt in ("columnar", "binary"):
+        starts = edges_ns[:-1] // 1_000_000
+        avgs = aggregation.bucket_averages(buckets)
+        if fmt == "binary":
+            return Response(aggregation.pack_binary(starts, avgs), mimetype="application/octet-stream")
+        return jsonify(aggregation.to_columns(
+            starts, avgs,
+            labels=[e.strftime(label_format) for e in edges[:-1]],
+            min=buckets["min"], max=buckets["max"], count=buckets["count"].tolist()
+        ))
+
+    return jsonify(aggregation.to_series(buckets, edges, label_format))
+
+
+# Nhiều cảm biến trong một request, các chuỗi dùng chung mốc bucket
+@blueprint.route("/api/<farm_name>/statistics")
+def get_multi_sensor_data(farm_name):
+    time_range = request.args.get("timeRange", "day")
+    selected_date = request.args.get("date", datetime.date.today().isoformat())
+    sensors = [s for s in request.args.get("sensors", "temperature,humidity,light").split(",") if s]
+
+    unknown = [s for s in sensors if s not in SENSOR_MAP]
+    if unknown:
+        return jsonify({"error": f"Unknown sensors: {', '.join(unknown)}"}), 400
+
+    edges, label_format = aggregation.bucket_edges(time_range, selected_date)
+    edges_ns = aggregation.to_ns(edges)
+
+    resources = [SENSOR_MAP[s] for s in sensors]
+    reading_store.schedule_sync(farm_name, resources)
+    period = aggregation.rollup_period(time_range)
+    rollups = reading_store.query_rollups_many(farm_name, resources, period, int(edges_ns[0]), int(edges_ns[-1]))
+
+    series = {}
+    for sensor, resource in zip(sensors, resources):
+        buckets = aggregation.aggregate_rollups(*rollups[resource], edges_ns)
+        points = aggregation.to_series(buckets, edges, label_format)
+        series[sensor] = {
+            "values": [p["value"] for p in points],
+            "min": [p["min"] for p in points],
+            "max": [p["max"] for p in points],
+            "count": [p["count"] for p in points]
+        }
+
+    return jsonify({
+        "timeRange": time_range,
+        "labels": [e.strftime(label_format) for e in edges[:-1]],
+        "starts": [int(e.timestamp() * 1000) for e in edges[:-1]],
+        "series": series
+    })
     
 
+def _parse_time_ns(value, default):
+    """Thời điểm dạng ISO ('2025-06-01', '2025-06-01T08:00') hoặc epoch ms -> epoch ns."""
+    if not value:
+        return default
+    if value.isdigit():
+        return int(value) * 1_000_000
+    return int(datetime.datetime.fromisoformat(value).timestamp()) * 1_000_000_000
+
+
+EXPORT_CSV_CHUNK = 500  # Số dòng CSV gom vào một lần yield
+
+# Xuất lịch sử reading dạng CSV / NDJSON, stream từng phần (bộ nhớ không phụ thuộc độ dài khoảng thời gian)
+@blueprint.route('/api/<farm_name>/readings/export')
+def export_readings(farm_name):
+    fmt = request.args.get("format", "csv")
+    if fmt not in ("csv", "ndjson"):
+        return jsonify({"error": "format must be csv or ndjson"}), 400
+    resources = [r for r in request.args.get("resources", ",".join(SENSOR_MAP.values())).split(",") if r]
+
+    try:
+        now_ns = edgex.now_ms() * 1_000_000
+        end_ns = _parse_time_ns(request.args.get("end"), now_ns)
+        start_ns = _parse_time_ns(request.args.get("start"), end_ns - 24 * 3600 * 1_000_000_000)
+    except ValueError as e:
+        return jsonify({"error": f"Invalid start/end: {e}"}), 400
+
+    reading_store.schedule_sync(farm_name, resources)
+
+    # Store local chỉ có dữ liệu từ reading cũ nhất đã lưu; lần sync đầu kéo về SYNC_BACKFILL_DAYS ngày
+    earliest = reading_store.first_origin(farm_name, resources)
+    if earliest is None:
+        return jsonify({"error": "Readings are not synced yet, retry later"}), 503, {"Retry-After": "30"}
+    if start_ns < earliest and start_ns < reading_store.backfill_start_ns():
+        return jsonify({
+            "error": "Requested range starts before the stored history",
+            "available_from": earliest // 1_000_000
+        }), 416
+
+    def generate():
+        # CSV qua csv.writer (quote tên có dấu phẩy / nháy / xuống dòng), mỗi EXPORT_CSV_CHUNK dòng yield một lần
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator="\n")
+        if fmt == "csv":
+            writer.writerow(["device", "resource", "origin", "time", "value"])
+        rows = 0
+        for origin, resource, value in reading_store.iter_readings(farm_name, resources, start_ns, end_ns):
+            time_str = datetime.datetime.fromtimestamp(origin / 1_000_000_000).isoformat()
+            if fmt != "csv":
+                yield json.dumps({"device": farm_name, "resource": resource, "origin": origin, "time": time_str, "value": value}) + "\n"
+                continue
+            writer.writerow([farm_name, resource, origin, time_str, value])
+            rows += 1
+            if rows % EXPORT_CSV_CHUNK == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue()
+
+    mimetype = "text/csv" if fmt == "csv" else "application/x-ndjson"
+    filename = secure_filename(f"{farm_name}-readings.{fmt}") or f"readings.{fmt}"
+    return Response(stream_with_context(generate()), mimetype=mimetype, headers={
+        "Content-Disposition": f'attachment; filename="{filename}"'
+    })
+
+
+RULE_NUM_FIELDS = [
+    "temp_min", "temp_max", "hum_min", "hum_max", "light_min", "light_max",
+    "repeat_days", "start_in_minutes", "end_in_minutes", "relay_index", "logic", "id"
+]
+
+# Ép kiểu các trường số của rule gửi lên từ giao diện
+def _normalize_rule(rule_json):
+    for f in RULE_NUM_FIELDS:
+        if f in rule_json:
+            try:
+                rule_json[f] = int(rule_json[f])
+            except Exception:
+                rule_json[f] = 0
+    return rule_json
+
+
+# Rule dùng chung một RuleRepository trong phạm vi request: metadata của device chỉ nạp một lần
+def _rule_manager(farm_name):
+    repositories = g.setdefault('rule_repositories', {})
+    if farm_name not in repositories:
+        repositories[farm_name] = RuleRepository(farm_name)
+    return Rule(device_name=farm_name, repository=repositories[farm_name])
+
+
 # Lay danh sach tat ca rule (de render tren giao dien) va xoa toan bo rule (it dung)
-@blueprint.route('/api/<farm_name>/rules/all', methods=['GET', 'DELETE'])
+@blueprint.route('/api/<farm_name>/rules/all', methods=['GET', 'PUT', 'DELETE'])
 def api_get_or_delete_all_rules(farm_name):
-    if request.method not in ['GET', 'DELETE']:
+    if request.method not in ['GET', 'PUT', 'DELETE']:
         return jsonify({"error": "Method not allowed"}), 405
-    if request.method == 'GET':
+    if request.method == 'PUT':
+        # Thay toàn bộ danh sách rule: chỉ gửi xuống thiết bị các slot thay đổi
+        data = request.get_json(silent=True)
+        rules = data.get("rules") if isinstance(data, dict) else data
+        if not isinstance(rules, list) or not all(isinstance(r, dict) for r in rules):
+            return jsonify({"error": "Missing rule list"}), 400
+        try:
+            result = _rule_manager(farm_name).sync_rules([_normalize_rule(r) for r in rules])
+            if result.get("error"):
+                return jsonify(result), 500
+            return jsonify(result)
+        except Exception as e:
+            return jsonify({"error": f"Lỗi khi đồng bộ rule: {str(e)}"}), 500
+    elif request.method == 'GET':
         try:
-            rule_manager = Rule(device_name=farm_name)
+            rule_manager = _rule_manager(farm_name)
             rules = rule_manager.get_rules()
             return jsonify({"success": True, "rules": rules})
         except Exception as e:
             return jsonify({"error": f"Lỗi khi lấy danh sách rule: {str(e)}"}), 500
     else:  # DELETE method
         try:
-            rule_manager = Rule(device_name=farm_name)
+            rule_manager = _rule_manager(farm_name)
             result = rule_manager.delete_all_rules()
             if result.get("success"):
                 return jsonify({"success": True, "message": "All rules deleted successfully"})
@@ -219,7 +543,7 @@ def api_add_or_delete_rule(farm_name):
         if not rule_id:
             return jsonify({"error": "Missing rule ID"}), 400
         try:
-            rule_manager = Rule(device_name=farm_name)
+            rule_manager = _rule_manager(farm_name)
             result = rule_manager.delete_rule(int(rule_id))
             if result.get("success"):
                 return jsonify({"success": True, "message": "Rule deleted successfully"})
@@ -233,18 +557,9 @@ def api_add_or_delete_rule(farm_name):
             if not rule_json:
                 return jsonify({"error": "Missing rule data"}), 400
             
-            num_fields = [
-                "temp_min", "temp_max", "hum_min", "hum_max", "light_min", "light_max",
-                "repeat_days", "start_in_minutes", "end_in_minutes", "relay_index", "logic", "id"
-            ]
-            for f in num_fields:
-                if f in rule_json:
-                    try:
-                        rule_json[f] = int(rule_json[f])
-                    except Exception:
-                        rule_json[f] = 0
-            
-            rule_manager = Rule(device_name=farm_name)
+            rule_json = _normalize_rule(rule_json)
+
+            rule_manager = _rule_manager(farm_name)
             # Check if rule_manager has any rules defined (assuming Rule has a method or attribute for this)
             # If not, return a message
             if hasattr(rule_manager, "rules") and not rule_manager.rules:
@@ -269,4 +584,107 @@ def api_add_or_delete_rule(farm_name):
             return jsonify({"error": f"Lỗi khi thêm rule: {str(e)}"}), 500
 
 
+# Thêm nhiều rule trong một request: lệnh SetRule gửi song song, metadata chỉ ghi một lần
+@blueprint.route('/api/<farm_name>/rules/batch', methods=['POST'])
+def api_add_rules_batch(farm_name):
+    data = request.get_json(silent=True)
+    rules = data.get("rules") if isinstance(data, dict) else data
+    if not rules or not isinstance(rules, list) or not all(isinstance(r, dict) for r in rules):
+        return jsonify({"error": "Missing rule list"}), 400
+
+    try:
+        result = _rule_manager(farm_name).add_rules([_normalize_rule(r) for r in rules])
+        if result.get("error"):
+            return jsonify(result), 500
+        return jsonify(result)
+    except Exception as e:
+        return jsonify({"error": f"Lỗi khi thêm rule: {str(e)}"}), 500
+
+
+# Kiểm tra rule trong metadata của toàn bộ thiết bị (rule thiếu trường / ngoài phạm vi)
+@blueprint.route('/api/rules/audit')
+def api_audit_rules():
+    try:
+        devices = edgex.get_all_devices()
+        table = RuleTable.from_devices(devices)
+        return jsonify({
+            "success": True,
+            "devices": len(devices),
+            "rules": len(table),
+            "invalid": table.error_report()
+        })
+    except Exception as e:
+        return jsonify({"error": f"Lỗi khi kiểm tra rule: {str(e)}"}), 500
+
+
+MAX_SIMULATION_POINTS = 100_000  # ~ 2 tháng dữ liệu theo phút
+SIMULATION_RESOURCES = ["NhietDo", "DoAm", "AnhSang"]
+
+# Mô phỏng rule (mặc định là các rule hiện có của thiết bị) trên dữ liệu cảm biến đã lưu
+@blueprint.route('/api/<farm_name>/rules/simulate', methods=['POST'])
+def api_simulate_rules(farm_name):
+    data = request.get_json(silent=True) or {}
+    try:
+        now_ns = edgex.now_ms() * 1_000_000
+        end_ns = _parse_time_ns(str(data.get("end") or ""), now_ns)
+        start_ns = _parse_time_ns(str(data.get("start") or ""), end_ns - 24 * 3600 * 1_000_000_000)
+        step_ns = int(data.get("step", 60)) * 1_000_000_000
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": f"Invalid start/end/step: {e}"}), 400
+    if step_ns <= 0 or end_ns <= start_ns:
+        return jsonify({"error": "Invalid start/end/step"}), 400
+    if (end_ns - start_ns) // step_ns > MAX_SIMULATION_POINTS:
+        return jsonify({"error": f"Too many points, increase step (max {MAX_SIMULATION_POINTS})"}), 400
+
+    rules = data.get("rules")
+    if rules is None:
+        rules = _rule_manager(farm_name).get_rules()
+    elif not isinstance(rules, list) or not all(isinstance(r, dict) for r in rules):
+        return jsonify({"error": "rules must be a list"}), 400
+    initial = data.get("initial") or {}
+    if not isinstance(initial, dict):
+        return jsonify({"error": "initial must be an object {relay_index: bool}"}), 400
+    try:
+        initial = {int(k): v for k, v in initial.items()}
+    except (TypeError, ValueError):
+        return jsonify({"error": "initial keys must be relay indexes (int)"}), 400
+    if not all(isinstance(v, bool) for v in initial.values()):
+        return jsonify({"error": "initial values must be true/false"}), 400
+
+    try:
+        reading_store.schedule_sync(farm_name, SIMULATION_RESOURCES)
+        # Lấy thêm một giờ trước start để có giá trị cảm biến ngay tại mốc đầu
+        lookback_ns = start_ns - aggregation.NS_PER_HOUR
+        sensors = {r: reading_store.query_series(farm_name, r, lookback_ns, end_ns) for r in SIMULATION_RESOURCES}
+        result = rule_simulator.simulate_rules(rules, sensors, start_ns, end_ns, step_ns, initial)
+        result.update(success=True, start=start_ns // 1_000_000, end=end_ns // 1_000_000, step=step_ns // 1_000_000_000)
+        return jsonify(result)
+    except Exception as e:
+        return jsonify({"error": f"Lỗi khi mô phỏng rule: {str(e)}"}), 500
+
+
+# Tìm kiếm device trong danh mục cục bộ (làm mới tăng dần từ core-metadata, tối đa một lần mỗi chu kỳ)
+@blueprint.route('/api/devices')
+@login_required
+def api_search_devices():
+    device_inventory.ensure_fresh()
 
+    farms = None
+    if request.args.get("farm"):
+        farms = [request.args["farm"]]
+    elif request.args.get("mine"):
+        farms = [farm.name for farm in current_user.farms]
+
+    try:
+        result = device_inventory.search(
+            q=request.args.get("q"),
+            label=request.args.get("label"),
+            farms=farms,
+            profile=request.args.get("profile"),
+            service=request.args.get("service"),
+            offset=request.args.get("offset", 0, type=int),
+            limit=request.args.get("limit", device_inventory.INVENTORY_PAGE_SIZE, type=int)
+        )
+        return jsonify(result)
+    except Exception as e:
+        return jsonify({"error": f"Lỗi khi tìm thiết bị: {str(e)}"}), 500
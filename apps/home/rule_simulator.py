@@ -0,0 +1,212 @@
+# -*- encoding: utf-8 -*-
+"""
+Mô phỏng các rule của thiết bị trên dữ liệu cảm biến lịch sử (NhietDo / DoAm / AnhSang).
+
+Cách hiểu rule giống giao diện automation:
+- Rule chỉ hoạt động trong khung giờ [start_in_minutes, end_in_minutes) của các ngày
+  start_date, start_date + repeat_days, ... (repeat_days = 0 được hiểu là mỗi ngày).
+  Khung giờ có start > end kéo dài qua nửa đêm sang ngày hôm sau; start == end là cả ngày.
+- Một cảm biến chỉ được xét khi khoảng [min, max] hẹp hơn toàn dải. Điều kiện nhiệt độ
+  đứng đầu; độ ẩm ghép vào bằng AND nếu bit 1 của logic bật (ngược lại OR), ánh sáng theo bit 2.
+  Rule không xét cảm biến nào thì điều kiện luôn đúng.
+- Trong khung giờ: điều kiện đúng -> relay = relay_value; sai và reverse_on_false -> đảo lại.
+  Ngoài khung giờ rule không tác động; relay giữ trạng thái cũ.
+- Nhiều rule cùng một relay: rule đứng sau trong danh sách ghi đè rule đứng trước.
+
+Toàn bộ tính toán là mảng (rule x mốc thời gian); chỉ có vòng lặp theo số rule để ghép lệnh.
+"""
+
+import datetime
+
+import numpy as np
+
+from .aggregation import NS_PER_SECOND, local_midnight_ns
+from .rule_table import RULE_EPOCH, RuleTable
+from .edgex_interface import (
+    RULE_TEMP_MIN, RULE_TEMP_MAX, RULE_HUM_MIN, RULE_HUM_MAX, RULE_LIGHT_MIN, RULE_LIGHT_MAX,
+)
+
+NS_PER_MINUTE = 60 * NS_PER_SECOND
+DEFAULT_STEP_NS = NS_PER_MINUTE
+RELAY_NAMES = {0: "FAN", 1: "LIGHT", 2: "PUMP1", 3: "PUMP2"}
+
+
+def time_grid(start_ns, end_ns, step_ns=DEFAULT_STEP_NS):
+    """Các mốc thời gian mô phỏng trong [start_ns, end_ns), cách đều step_ns."""
+    return np.arange(start_ns, end_ns, step_ns, dtype=np.int64)
+
+
+def sample(origins, values, grid):
+    """Giá trị cảm biến tại mỗi mốc = reading gần nhất trước đó (NaN nếu chưa có reading nào)."""
+    index = np.searchsorted(origins, grid, side="right") - 1
+    if not len(values):
+        return np.full(len(grid), np.nan)
+    return np.where(index >= 0, values[np.clip(index, 0, None)], np.nan)
+
+
+def calendar(grid):
+    """
+    Ngày (số ngày từ 01/01/2025) và phút trong ngày theo giờ địa phương của từng mốc.
+    Nửa đêm chỉ tính một lần cho mỗi ngày nên chi phí theo số ngày, không theo số mốc.
+    """
+    first = local_midnight_ns(grid[0])
+    midnights = [first]
+    while midnights[-1] <= grid[-1]:
+        # +26 giờ rồi làm tròn về nửa đêm: an toàn cả với ngày 23 / 25 giờ khi đổi giờ
+        midnights.append(local_midnight_ns(midnights[-1] + 26 * 3600 * NS_PER_SECOND))
+    midnights = np.array(midnights, dtype=np.int64)
+
+    day_index = np.searchsorted(midnights, grid, side="right") - 1
+    minutes = (grid - midnights[day_index]) // NS_PER_MINUTE
+    first_day = (np.datetime64(datetime.date.fromtimestamp(first // NS_PER_SECOND), "D") - RULE_EPOCH).astype(np.int64)
+    return first_day + day_index, minutes
+
+
+def schedule_mask(table, days, minutes):
+    """Mảng bool (rule x mốc): mốc nằm trong khung giờ của một ngày rule chạy."""
+    records = table.records
+    start = records["start_in_minutes"].astype(np.int64)[:, None]
+    end = records["end_in_minutes"].astype(np.int64)[:, None]
+    start_date = records["start_date"].astype(np.int64)[:, None]
+    repeat = np.maximum(records["repeat_days"].astype(np.int64), 1)[:, None]
+
+    def runs_on(day):
+        return (day >= start_date) & ((day - start_date) % repeat == 0)
+
+    today, yesterday = runs_on(days[None, :]), runs_on(days[None, :] - 1)
+    m = minutes[None, :]
+    same_day = (m >= start) & (m < end) & today
+    overnight = ((m >= start) & today) | ((m < end) & yesterday)
+    return np.where(start < end, same_day, np.where(start > end, overnight, today))
+
+
+def condition_mask(table, temp, hum, light):
+    """Mảng bool (rule x mốc): điều kiện cảm biến của rule đúng (NaN = không thỏa)."""
+    records = table.records
+    logic = records["logic"].astype(np.int64)[:, None]
+
+    def bounds(name, scale=1.0, offset=0.0):
+        return ((records[name + "_min"].astype(np.float64) - offset) / scale)[:, None], \
+               ((records[name + "_max"].astype(np.float64) - offset) / scale)[:, None]
+
+    def check(values, lo, hi, full_lo, full_hi):
+        active = (lo > full_lo) | (hi < full_hi)
+        with np.errstate(invalid="ignore"):
+            inside = (values[None, :] >= lo) & (values[None, :] <= hi)
+        return active, inside
+
+    temp_active, temp_ok = check(temp, *bounds("temp", 10.0, 200.0), RULE_TEMP_MIN, RULE_TEMP_MAX)
+    hum_active, hum_ok = check(hum, *bounds("hum"), RULE_HUM_MIN, RULE_HUM_MAX)
+    light_active, light_ok = check(light, *bounds("light"), RULE_LIGHT_MIN, RULE_LIGHT_MAX)
+
+    result = np.where(temp_active, temp_ok, True)
+    has_any = np.broadcast_to(temp_active, result.shape)
+    for active, ok, bit in ((hum_active, hum_ok, 1), (light_active, light_ok, 2)):
+        use_and = ((logic >> bit) & 1).astype(bool)
+        combined = np.where(use_and, result & ok, result | ok)
+        # Cảm biến đầu tiên được xét thay thế giá trị mặc định "luôn đúng"
+        combined = np.where(has_any, combined, ok)
+        result = np.where(active, combined, result)
+        has_any = has_any | active
+    return result
+
+
+def simulate(table, grid, temp, hum, light, initial=None):
+    """
+    Mô phỏng trạng thái từng relay.
+
+    Args:
+        table (RuleTable): các rule hợp lệ, theo thứ tự áp dụng.
+        grid (np.ndarray): mốc thời gian (ns) tăng dần.
+        temp, hum, light (np.ndarray): giá trị cảm biến tại từng mốc.
+        initial (dict): {relay_index: bool} trạng thái trước mốc đầu; mặc định là chưa biết.
+
+    Returns:
+        dict: {relay_index: (state, rule_id)}, state int8 (1 bật, 0 tắt, -1 chưa biết) và
+              rule_id int (-1 nếu chưa có rule nào tác động) tại từng mốc.
+    """
+    initial = initial or {}
+    if not len(table) or not len(grid):
+        return {}
+
+    days, minutes = calendar(grid)
+    active = schedule_mask(table, days, minutes)
+    met = condition_mask(table, temp, hum, light)
+
+    records = table.records
+    value = records["relay_value"][:, None]
+    reverse = records["reverse_on_false"][:, None]
+    action = np.where(active & met, value.astype(np.int8),
+                      np.where(active & reverse, (~value).astype(np.int8), np.int8(-1)))
+
+    timelines = {}
+    positions = np.arange(len(grid))
+    for relay in np.unique(records["relay_index"]).tolist():
+        command = np.full(len(grid), -1, dtype=np.int8)
+        rule_of = np.full(len(grid), -1, dtype=np.int64)
+        for r in np.flatnonzero(records["relay_index"] == relay):
+            acts = action[r] >= 0
+            command = np.where(acts, action[r], command)
+            rule_of = np.where(acts, int(records["id"][r]), rule_of)
+
+        # Giữ trạng thái của lệnh gần nhất (forward fill)
+        last = np.maximum.accumulate(np.where(command >= 0, positions, -1))
+        start_state = -1 if relay not in initial else int(bool(initial[relay]))
+        state = np.where(last >= 0, command[np.clip(last, 0, None)], start_state).astype(np.int8)
+        rule_id = np.where(last >= 0, rule_of[np.clip(last, 0, None)], -1)
+        timelines[relay] = (state, rule_id)
+    return timelines
+
+
+def to_segments(grid, state, rule_id, step_ns):
+    """Nén timeline thành các đoạn trạng thái liên tiếp: [{"start", "end", "state", "rule"}] (ms)."""
+    starts = np.flatnonzero(np.diff(state, prepend=np.int8(-2)) != 0)
+    ends = np.append(starts[1:], len(grid))
+    segments = []
+    for s, e in zip(starts.tolist(), ends.tolist()):
+        segments.append({
+            "start": int(grid[s]) // 1_000_000,
+            "end": (int(grid[e - 1]) + step_ns) // 1_000_000,
+            "state": None if state[s] < 0 else bool(state[s]),
+            "rule": None if rule_id[s] < 0 else int(rule_id[s])
+        })
+    return segments
+
+
+def summarize(grid, timelines, step_ns):
+    """Kết quả JSON: các đoạn trạng thái, số phút bật và số lần chuyển trạng thái của mỗi relay."""
+    relays = []
+    for relay, (state, rule_id) in sorted(timelines.items()):
+        known = state[state >= 0]
+        relays.append({
+            "relay_index": relay,
+            "name": RELAY_NAMES.get(relay),
+            "on_minutes": round(float((state == 1).sum()) * step_ns / NS_PER_MINUTE, 3),
+            "switches": int(np.count_nonzero(known[1:] != known[:-1])),
+            "segments": to_segments(grid, state, rule_id, step_ns)
+        })
+    return relays
+
+
+def simulate_rules(rules, sensors, start_ns, end_ns, step_ns=DEFAULT_STEP_NS, initial=None):
+    """
+    Mô phỏng một danh sách rule (dict) trên dữ liệu lịch sử.
+
+    Args:
+        sensors (dict): {"NhietDo" | "DoAm" | "AnhSang": (origins ns, values)}, origins tăng dần.
+
+    Returns:
+        dict: {"relays": [...], "invalid": [...], "points": số mốc}
+    """
+    table = RuleTable.from_rules(rules)
+    invalid = table.error_report()
+    table = table[~table.invalid]
+
+    grid = time_grid(start_ns, end_ns, step_ns)
+    empty = (np.zeros(0, dtype=np.int64), np.zeros(0))
+    temp = sample(*sensors.get("NhietDo", empty), grid)
+    hum = sample(*sensors.get("DoAm", empty), grid)
+    light = sample(*sensors.get("AnhSang", empty), grid)
+
+    timelines = simulate(table, grid, temp, hum, light, initial)
+    return {"relays": summarize(grid, timelines, step_ns), "invalid": invalid, "points": len(grid)}
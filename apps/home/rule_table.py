@@ -0,0 +1,279 @@
+# -*- encoding: utf-8 -*-
+"""
+Bảng rule dạng NumPy structured array, dùng cho kiểm tra / xử lý hàng loạt.
+
+Mỗi dòng là một rule với các trường đúng như bố cục 128 bit (RULE_LAYOUT); nhiệt độ,
+start_date... lưu ở dạng số nguyên đã mã hóa như trên gói tin. Kiểm tra phạm vi và
+(giải) mã hóa sang gói tin 16 byte đều vector hóa: gói tin được xem là hai word uint64
+big-endian, mỗi trường lấy ra / ghép vào bằng shift và mask trên cả cột.
+"""
+
+import numpy as np
+
+from .edgex_interface import (
+    RULE_LAYOUT, RULE_SIZE,
+    RULE_TEMP_MIN, RULE_TEMP_MAX, RULE_HUM_MIN, RULE_HUM_MAX, RULE_LIGHT_MIN, RULE_LIGHT_MAX,
+)
+
+RULE_DTYPE = np.dtype([
+    ("id", "u1"),
+    ("repeat_days", "u1"),
+    ("start_in_minutes", "u2"),
+    ("end_in_minutes", "u2"),
+    ("start_date", "u2"),
+    ("relay_index", "u1"),
+    ("relay_value", "?"),
+    ("reverse_on_false", "?"),
+    ("logic", "u1"),
+    ("temp_min", "u2"),
+    ("temp_max", "u2"),
+    ("hum_min", "u2"),
+    ("hum_max", "u2"),
+    ("light_min", "u2"),
+    ("light_max", "u2"),
+])
+
+# Phạm vi hợp lệ của giá trị đã mã hóa (gồm cả hai đầu)
+FIELD_RANGES = {
+    "id": (0, 31),
+    "repeat_days": (0, 31),
+    "start_in_minutes": (0, 1439),
+    "end_in_minutes": (0, 1439),
+    "start_date": (0, 65535),
+    "relay_index": (0, 7),
+    "relay_value": (0, 1),
+    "reverse_on_false": (0, 1),
+    "logic": (0, 7),
+    "temp_min": (int(RULE_TEMP_MIN * 10) + 200, int(RULE_TEMP_MAX * 10) + 200),
+    "temp_max": (int(RULE_TEMP_MIN * 10) + 200, int(RULE_TEMP_MAX * 10) + 200),
+    "hum_min": (RULE_HUM_MIN, RULE_HUM_MAX),
+    "hum_max": (RULE_HUM_MIN, RULE_HUM_MAX),
+    "light_min": (RULE_LIGHT_MIN, RULE_LIGHT_MAX),
+    "light_max": (RULE_LIGHT_MIN, RULE_LIGHT_MAX),
+}
+
+RULE_EPOCH = np.datetime64("2025-01-01", "D")
+
+
+def _bit_positions():
+    """(tên, số bit, shift tính từ bit thấp nhất của số 128 bit) cho từng trường."""
+    positions, shift = [], 128
+    for name, bits in RULE_LAYOUT:
+        shift -= bits
+        positions.append((name, bits, shift))
+    return positions
+
+
+_POSITIONS = _bit_positions()
+
+
+def _float_column(rules, name):
+    """Cột float của một trường; thiếu hoặc không phải số thành NaN."""
+    values = [rule.get(name) for rule in rules]
+    try:
+        return np.array(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        column = np.full(len(values), np.nan)
+        for i, value in enumerate(values):
+            try:
+                column[i] = float(value)
+            except (TypeError, ValueError):
+                pass
+        return column
+
+
+def _date_column(rules):
+    """Số ngày từ 01/01/2025 của 'start_date' ('yyyy-mm-dd'); thiếu hoặc sai định dạng thành NaN."""
+    values = [rule.get("start_date") for rule in rules]
+    try:
+        dates = np.array(values, dtype="datetime64[D]")
+    except (TypeError, ValueError):
+        dates = np.full(len(values), np.datetime64("NaT"), dtype="datetime64[D]")
+        for i, value in enumerate(values):
+            try:
+                dates[i] = np.datetime64(value, "D")
+            except (TypeError, ValueError):
+                pass
+    days = (dates - RULE_EPOCH).astype(np.int64).astype(np.float64)
+    days[np.isnat(dates)] = np.nan
+    return days
+
+
+def _columns_from_rules(rules):
+    """
+    Các cột giá trị đã mã hóa (float64, NaN = thiếu) từ list rule dạng dict,
+    kẹp nhiệt độ / độ ẩm / ánh sáng giống encode_rule.
+    """
+    columns = {}
+    for name, _ in RULE_LAYOUT:
+        if name == "start_date":
+            columns[name] = _date_column(rules)
+        elif name in ("relay_value", "reverse_on_false"):
+            columns[name] = np.array([1.0 if rule.get(name) else 0.0 for rule in rules])
+        else:
+            columns[name] = _float_column(rules, name)
+
+    for name in ("temp_min", "temp_max"):
+        columns[name] = np.trunc(np.clip(columns[name], RULE_TEMP_MIN, RULE_TEMP_MAX) * 10) + 200
+    for name in ("hum_min", "hum_max"):
+        columns[name] = np.trunc(np.clip(columns[name], RULE_HUM_MIN, RULE_HUM_MAX))
+    for name in ("light_min", "light_max"):
+        columns[name] = np.trunc(np.clip(columns[name], RULE_LIGHT_MIN, RULE_LIGHT_MAX))
+    return columns
+
+
+def validate_columns(columns):
+    """
+    Kiểm tra phạm vi trên cả cột.
+
+    Returns:
+        dict: {tên trường: mảng bool, True ở các dòng không hợp lệ}
+    """
+    errors = {}
+    for name, (lo, hi) in FIELD_RANGES.items():
+        column = columns[name]
+        errors[name] = np.isnan(column) | (column < lo) | (column > hi) | (column != np.trunc(column))
+    return errors
+
+
+class RuleTable:
+    """
+    Danh sách rule (có thể của nhiều device) trong một structured array RULE_DTYPE.
+
+    - records: mảng RULE_DTYPE, giá trị đã mã hóa như trên gói tin.
+    - devices: mảng tên device của từng dòng (None nếu không gắn device).
+    - errors: {tên trường: mảng bool} các dòng có trường ngoài phạm vi; giá trị
+      lưu trong records của các trường lỗi đã bị kẹp nên không dùng được.
+    """
+
+    def __init__(self, records, devices=None, errors=None):
+        self.records = records
+        self.devices = np.asarray(devices if devices is not None else [None] * len(records), dtype=object)
+        if errors is None:
+            errors = validate_columns({name: records[name].astype(np.float64) for name, _ in RULE_LAYOUT})
+        self.errors = errors
+
+    @classmethod
+    def _from_columns(cls, columns, devices):
+        errors = validate_columns(columns)
+        n = len(devices)
+        records = np.zeros(n, dtype=RULE_DTYPE)
+        for name, bits in RULE_LAYOUT:
+            column = np.nan_to_num(columns[name], nan=0.0)
+            records[name] = np.clip(column, 0, (1 << bits) - 1).astype(np.int64)
+        return cls(records, devices, errors)
+
+    @classmethod
+    def from_rules(cls, rules, device=None):
+        """Bảng từ list rule dạng dict (như trong metadata / request)."""
+        rules = list(rules)
+        return cls._from_columns(_columns_from_rules(rules), [device] * len(rules))
+
+    @classmethod
+    def from_devices(cls, devices):
+        """Bảng rule của nhiều device từ kết quả get_all_devices() (protocols["Rules"]["rules"])."""
+        rules, names = [], []
+        for device in devices:
+            device_rules = (device.get("protocols") or {}).get("Rules", {}).get("rules") or []
+            rules.extend(device_rules)
+            names.extend([device.get("name")] * len(device_rules))
+        return cls._from_columns(_columns_from_rules(rules), names)
+
+    @classmethod
+    def from_payloads(cls, buffer, device=None):
+        """Bảng từ buffer gồm nhiều gói tin 16 byte liền nhau (hoặc list các gói tin)."""
+        if not isinstance(buffer, (bytes, bytearray, memoryview)):
+            buffer = b"".join(bytes(p) for p in buffer)
+        if len(buffer) % RULE_SIZE:
+            raise ValueError("Độ dài buffer phải là bội số của 16 byte.")
+
+        words = np.frombuffer(buffer, dtype=">u8").astype(np.uint64).reshape(-1, 2)
+        hi, lo = words[:, 0], words[:, 1]
+        columns = {}
+        for name, bits, shift in _POSITIONS:
+            mask = np.uint64((1 << bits) - 1)
+            if shift >= 64:
+                column = hi >> np.uint64(shift - 64)
+            elif shift + bits <= 64:
+                column = lo >> np.uint64(shift)
+            else:
+                # Trường nằm vắt qua hai word
+                column = (hi << np.uint64(64 - shift)) | (lo >> np.uint64(shift))
+            columns[name] = (column & mask).astype(np.float64)
+        return cls._from_columns(columns, [device] * len(hi))
+
+    @classmethod
+    def concat(cls, tables):
+        tables = list(tables)
+        if not tables:
+            return cls(np.zeros(0, dtype=RULE_DTYPE))
+        return cls(
+            np.concatenate([t.records for t in tables]),
+            np.concatenate([t.devices for t in tables]),
+            {name: np.concatenate([t.errors[name] for t in tables]) for name in FIELD_RANGES}
+        )
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, index):
+        """Lọc dòng (mask / mảng chỉ số / slice), trả về RuleTable mới."""
+        if isinstance(index, (int, np.integer)):
+            index = [index]
+        return RuleTable(self.records[index], self.devices[index],
+                         {name: mask[index] for name, mask in self.errors.items()})
+
+    @property
+    def invalid(self):
+        """Mảng bool: dòng có ít nhất một trường không hợp lệ."""
+        invalid = np.zeros(len(self), dtype=bool)
+        for mask in self.errors.values():
+            invalid |= mask
+        return invalid
+
+    def error_report(self):
+        """Danh sách {"device", "id", "fields"} cho các dòng không hợp lệ."""
+        rows = np.flatnonzero(self.invalid)
+        return [{
+            "device": self.devices[i],
+            "id": None if self.errors["id"][i] else int(self.records["id"][i]),
+            "fields": [name for name, mask in self.errors.items() if mask[i]]
+        } for i in rows.tolist()]
+
+    def to_payloads(self):
+        """Mã hóa toàn bộ bảng thành buffer gói tin 16 byte liền nhau (cùng thứ tự dòng)."""
+        hi = np.zeros(len(self), dtype=np.uint64)
+        lo = np.zeros(len(self), dtype=np.uint64)
+        for name, bits, shift in _POSITIONS:
+            column = self.records[name].astype(np.uint64)
+            if shift >= 64:
+                hi |= column << np.uint64(shift - 64)
+            elif shift + bits <= 64:
+                lo |= column << np.uint64(shift)
+            else:
+                hi |= column >> np.uint64(64 - shift)
+                lo |= column << np.uint64(shift)  # Bit tràn khỏi 64 bit bị bỏ
+        return np.stack([hi, lo], axis=1).astype(">u8").tobytes()
+
+    def payloads(self):
+        """Như to_payloads() nhưng tách thành list bytes, mỗi phần tử một rule."""
+        buffer = self.to_payloads()
+        return [buffer[i:i + RULE_SIZE] for i in range(0, len(buffer), RULE_SIZE)]
+
+    def to_rules(self):
+        """Chuyển về list rule dạng dict, cùng dạng với decode_rule()."""
+        records = self.records
+        dates = (RULE_EPOCH + records["start_date"].astype("timedelta64[D]")).astype(str)
+        temp_min = (records["temp_min"].astype(np.int64) - 200) / 10.0
+        temp_max = (records["temp_max"].astype(np.int64) - 200) / 10.0
+
+        rules = []
+        for i in range(len(records)):
+            rule = {name: int(records[name][i]) for name, _ in RULE_LAYOUT}
+            rule["relay_value"] = bool(records["relay_value"][i])
+            rule["reverse_on_false"] = bool(records["reverse_on_false"][i])
+            rule["temp_min"] = float(temp_min[i])
+            rule["temp_max"] = float(temp_max[i])
+            rule["start_date"] = str(dates[i])
+            rules.append(rule)
+        return rules
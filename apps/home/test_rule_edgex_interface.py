@@ -84,8 +84,69 @@ def test_create_rule2():
     result = tu.add_rule(rule_json=rule)
     print(result)
 
+def test_rule_codec():
+    print("🧮 Kiểm tra mã hóa / giải mã rule")
+    rule = {
+        "id": 30,
+        "repeat_days": 1,
+        "start_in_minutes": 8 * 60 + 0,
+        "end_in_minutes": 20 * 60 + 0,
+        "start_date": "2025-06-01",
+        "relay_index": 1,
+        "relay_value": True,
+        "reverse_on_false": True,
+        "logic": 0,
+        "temp_min": 25.5,
+        "temp_max": 35,
+        "hum_min": 30,
+        "hum_max": 70,
+        "light_min": 100,
+        "light_max": 1000
+    }
+    payload = edgex.encode_rule(rule)
+    print(",".join(str(b) for b in payload))
+    decoded = edgex.decode_rule(payload)
+    print(decoded)
+    assert edgex.encode_rule(decoded) == payload
+    assert edgex.decode_rules(edgex.encode_rules([rule, decoded])) == [decoded, decoded]
+    print()
+
+# Gói tin mẫu do bộ mã hóa BitArray cũ tạo ra; encode_rule phải cho ra đúng từng byte
+RULE_GOLDEN = [
+    ({
+        "id": 30, "repeat_days": 1, "start_in_minutes": 480, "end_in_minutes": 1200, "start_date": "2025-06-01",
+        "relay_index": 1, "relay_value": True, "reverse_on_false": True, "logic": 0,
+        "temp_min": 25.5, "temp_max": 35, "hum_min": 30, "hum_max": 70, "light_min": 100, "light_max": 1000
+    }, "f04f04b000973871e2607846006403e8"),
+    # Giá trị biên: id / repeat_days / phút / relay_index / logic lớn nhất, nhiệt độ -20 và 80,
+    # chỉ bật relay_value
+    ({
+        "id": 31, "repeat_days": 31, "start_in_minutes": 1439, "end_in_minutes": 1439, "start_date": "2025-01-01",
+        "relay_index": 7, "relay_value": True, "reverse_on_false": False, "logic": 7,
+        "temp_min": -20, "temp_max": 80, "hum_min": 0, "hum_max": 100, "light_min": 0, "light_max": 65535
+    }, "ffecfd9f0000f7003e8000640000ffff"),
+    # Giá trị nhỏ nhất, nhiệt độ ngoài phạm vi bị kẹp, chỉ bật reverse_on_false
+    ({
+        "id": 0, "repeat_days": 0, "start_in_minutes": 0, "end_in_minutes": 0, "start_date": "2026-12-31",
+        "relay_index": 0, "relay_value": False, "reverse_on_false": True, "logic": 5,
+        "temp_min": -99, "temp_max": 120, "hum_min": 45, "hum_max": 55, "light_min": 65535, "light_max": 0
+    }, "0000000002d90d003e80b437ffff0000"),
+]
+
+def test_rule_codec_golden():
+    print("🧮 So khớp mã hóa rule với gói tin mẫu")
+    for rule, expected in RULE_GOLDEN:
+        payload = edgex.encode_rule(rule)
+        assert payload == bytes.fromhex(expected), f"{payload.hex()} != {expected}"
+        assert edgex.encode_rule(edgex.decode_rule(payload)) == payload
+    assert edgex.encode_rules([rule for rule, _ in RULE_GOLDEN]) == bytes.fromhex("".join(h for _, h in RULE_GOLDEN))
+    print("OK")
+    print()
+
 
 if __name__ == "__main__":
+    test_rule_codec()
+    test_rule_codec_golden()
     test_create_rule1()
     test_create_rule2()
 
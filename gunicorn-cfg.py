@@ -3,8 +3,14 @@
 Copyright (c) 2019 - present AppSeed.us
 """
 
+import os
+
 bind = '0.0.0.0:5005'
 workers = 1
+# SSE (/api/<farm>/stream) giữ kết nối lâu: cần worker có luồng (gthread) hoặc gevent.
+# Với gthread mỗi client SSE giữ một luồng; STREAM_MAX_CLIENTS phải nhỏ hơn threads
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.getenv('GUNICORN_THREADS', 16))
 accesslog = '-'
 loglevel = 'debug'
 capture_output = True
@@ -3,13 +3,14 @@ const farmName = localStorage.getItem('farmName'); // Lấy farmName từ localS
 // Hàm lấy dữ liệu thật từ Flask/edgex
 export async function fetchSensorData(sensorType, timeRange, selectedDate) {
     try {
-        const res = await fetch(`/api/${farmName}/statistics/${sensorType}?timeRange=${timeRange}&date=${selectedDate}`);
+        // format=columnar: server trả về các mảng song song (labels / values) thay vì list object
+        const res = await fetch(`/api/${farmName}/statistics/${sensorType}?timeRange=${timeRange}&date=${selectedDate}&format=columnar`);
         const data = await res.json();
 
         return {
             sensorType,
-            labels: data.map(d => d.time),
-            values: data.map(d => d.value),
+            labels: data.labels || data.timestamps.map(t => formatTimestamp(t, timeRange)),
+            values: data.values,
             unit: getUnit(sensorType)
         };
     } catch (err) {
@@ -23,6 +24,13 @@ export async function fetchSensorData(sensorType, timeRange, selectedDate) {
     }
 }
 
+function formatTimestamp(ms, timeRange) {
+    const d = new Date(ms);
+    const pad = v => String(v).padStart(2, '0');
+    const time = `${pad(d.getHours())}:${pad(d.getMinutes())}`;
+    return timeRange === 'day' ? time : `${pad(d.getDate())}/${pad(d.getMonth() + 1)} ${time}`;
+}
+
 function getUnit(sensorType) {
     const units = {
         humidity: '%',